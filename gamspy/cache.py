@@ -0,0 +1,116 @@
+# gamspy - Build and run GAMS models from Python
+# Copyright (C) 2014 Joel Goop
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import os
+import shutil
+import hashlib
+import tempfile
+
+
+class SolveCache(object):
+    """On-disk cache of solve results, keyed by a hash of the inputs.
+
+    Each entry is a directory named by its key, containing copies of the
+    result files. The entries that were used least recently are removed when
+    the total size exceeds max_bytes."""
+    def __init__(self, cache_dir, max_bytes=1e9):
+        super(SolveCache, self).__init__()
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def make_key(self,files=(),texts=(),settings=None):
+        """Hash the contents of files, the strings in texts and the items of
+        the dicts in settings."""
+        h = hashlib.sha1()
+        for path in files:
+            with open(path,'rb') as f:
+                for chunk in iter(lambda: f.read(1<<20),b''):
+                    h.update(chunk)
+            h.update(b'\0')
+        for text in texts:
+            h.update(text)
+            h.update(b'\0')
+        for d in (settings if settings else []):
+            h.update(repr(sorted(d.items())))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def entry_dir(self,key):
+        return os.path.join(self.cache_dir,key)
+
+    def get(self,key,targets):
+        """Copy the files of entry key to targets, a dict of paths by entry
+        file name. Return False if there is no such entry."""
+        entry = self.entry_dir(key)
+        if not os.path.isdir(entry):
+            return False
+        try:
+            for name,path in targets.items():
+                shutil.copyfile(os.path.join(entry,name),path)
+            # Mark entry as recently used
+            os.utime(entry,None)
+        except (IOError,OSError):
+            # Evicted by another process while copying
+            if os.path.isdir(entry):
+                raise
+            return False
+        return True
+
+    def put(self,key,sources):
+        """Store copies of sources, a dict of paths by entry file name, as
+        entry key and evict old entries if needed. If the entry already
+        exists (e.g. stored by another process for the same inputs), it is
+        kept as it is."""
+        entry = self.entry_dir(key)
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir,prefix='.tmp')
+        try:
+            for name,path in sources.items():
+                shutil.copyfile(path,os.path.join(tmp_dir,name))
+            try:
+                os.rename(tmp_dir,entry)
+            except OSError:
+                if not os.path.isdir(entry):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir,ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """Return list of (last used time,size,key) for all entries."""
+        out = []
+        for key in os.listdir(self.cache_dir):
+            entry = self.entry_dir(key)
+            if key.startswith('.tmp') or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry,name)) for name in os.listdir(entry))
+            out.append((os.path.getmtime(entry),size,key))
+        return out
+
+    def evict(self):
+        """Remove least recently used entries until total size is at most
+        max_bytes."""
+        entries = sorted(self.entries())
+        total = sum(size for _,size,_ in entries)
+        while entries and total > self.max_bytes:
+            _,size,key = entries.pop(0)
+            shutil.rmtree(self.entry_dir(key),ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for _,_,key in self.entries():
+            shutil.rmtree(self.entry_dir(key),ignore_errors=True)
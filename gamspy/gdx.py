@@ -15,17 +15,23 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 from gams import GamsWorkspace, GamsDatabase, GamsParameter, \
-                 GamsSet, GamsVariable, GamsException
+                 GamsSet, GamsVariable, GamsEquation, GamsException
+import gdxcc
+import numpy as np
+import gdx_utils
 import re
 from csv import writer
 import contextlib
 
 VALID_FIELDS = ["level","upper","lower","marginal"]
+SET_TYPES = [gdxcc.GMS_DT_SET,gdxcc.GMS_DT_ALIAS]
+# Position of fields in GDX record values
+FIELD_INDEX = {"level": 0, "marginal": 1, "lower": 2, "upper": 3, "scale": 4}
 
 @contextlib.contextmanager
-def get_reader(gdx_file):
+def get_reader(gdx_file,lazy=False):
     try:
-        r = GdxReader(gdx_file)
+        r = GdxReader(gdx_file,lazy=lazy)
         r.open()
         yield r
     finally:
@@ -34,10 +40,18 @@ def get_reader(gdx_file):
 
 # Handle gdx files
 class GdxReader(object):
-    """Class to read GDX files"""
-    def __init__(self,gdx_file):
+    """Class to read GDX files.
+
+    If lazy is True, only the symbol table is indexed on open and symbols
+    are read from file when requested, instead of loading the whole file
+    into a GamsDatabase."""
+    def __init__(self,gdx_file,lazy=False):
         super(GdxReader, self).__init__()
         self.gdx_file = gdx_file
+        self.lazy = lazy
+        self.gdx_handle = None
+        self.uels = None
+        self.symbols = None
 
     def __enter__(self):
         self.open()
@@ -48,15 +62,155 @@ class GdxReader(object):
 
     def open(self):
         self.ws = GamsWorkspace()
-        self.db = self.ws.add_database_from_gdx(self.gdx_file)
+        if self.lazy:
+            self.db = None
+            self._index_symbols()
+        else:
+            self.db = self.ws.add_database_from_gdx(self.gdx_file)
 
     def close(self):
+        if self.gdx_handle is not None:
+            gdxcc.gdxClose(self.gdx_handle)
+            gdxcc.gdxFree(self.gdx_handle)
+            self.gdx_handle = None
         del self.db, self.ws
 
+    # Open file with the low-level GDX API (used by columnar readers)
+    def _open_gdx(self):
+        if self.gdx_handle is None:
+            h = gdx_utils.new_gdx_handle(gdxcc,self.ws.system_directory)
+            if not gdxcc.gdxOpenRead(h,self.gdx_file)[0]:
+                gdxcc.gdxFree(h)
+                raise IOError("Could not open '{}'.".format(self.gdx_file))
+            self.gdx_handle = h
+        return self.gdx_handle
+
+    # Index symbol table as {lower case name: (number,name,dim,type)}
+    def _index_symbols(self):
+        h = self._open_gdx()
+        self.symbols = {}
+        for symnr in xrange(1,gdxcc.gdxSystemInfo(h)[1]+1):
+            rc,name,dim,sym_type = gdxcc.gdxSymbolInfo(h,symnr)
+            self.symbols[name.lower()] = (symnr,name,dim,sym_type)
+        return self.symbols
+
+    def _symbol_info(self,name):
+        if self.symbols is None:
+            self._index_symbols()
+        try:
+            return self.symbols[name.lower()]
+        except KeyError:
+            raise GdxSymbolNotFoundError("A symbol named '{0}' could not be retrieved.".format(name))
+
+    # Get array of labels indexed by UEL number (position 0 is unused)
+    def get_uels(self):
+        if self.uels is None:
+            h = self._open_gdx()
+            nuels = gdxcc.gdxSystemInfo(h)[2]
+            uels = np.empty(nuels+1,dtype=object)
+            uels[0] = ''
+            for i in xrange(1,nuels+1):
+                uels[i] = gdxcc.gdxUMUelGet(h,i)[1]
+            self.uels = uels
+        return self.uels
+
+    # Get UEL numbers of labels, 0 for labels not in file
+    def get_uel_numbers(self,labels):
+        uels = self.get_uels()[1:].astype(str)
+        labels = np.asarray(labels).astype(str)
+        if not uels.size:
+            return np.zeros(labels.shape,dtype=np.int32)
+        sorter = np.argsort(uels)
+        pos = np.searchsorted(uels,labels,sorter=sorter).clip(max=uels.size-1)
+        found = uels[sorter[pos]]==labels
+        return np.where(found,sorter[pos]+1,0).astype(np.int32)
+
+    # Read keys as (n,dim) array of UEL numbers and all record values
+    def _read_records(self,name):
+        symnr,_,dim,_ = self._symbol_info(name)
+        return gdx_utils.read_raw_records(self._open_gdx(),gdxcc,symnr,dim)
+
+    # Read symbol as tuples of labels and values of field (lazy mode)
+    def _read_labeled(self,name,field,sym_types):
+        if self._symbol_info(name)[3] not in sym_types:
+            raise TypeError("'{0}' is not of the requested type in the current gdx.".format(name))
+        keys,values = self._read_records(name)
+        uels = self.get_uels()
+        return [tuple(row) for row in uels[keys]],values[:,FIELD_INDEX[field]]
+
+    # Get field of symbol as UEL-number key columns (labels in get_uels())
+    # and float64 value column. If a LabelRegistry is given, keys are codes
+    # in the registry instead.
+    def get_columns(self,name,field="level",registry=None):
+        if field not in FIELD_INDEX:
+            raise ValueError("Field type is not recognised.")
+        keys,values = self._read_records(name)
+        if registry is not None:
+            keys = registry.encode(self.get_uels()[1:])[keys-1] if keys.size else keys
+        return keys,values[:,FIELD_INDEX[field]]
+
+    # Get several fields of several symbols with one pass over the records
+    # of each symbol. Returns dict of structured arrays with key columns
+    # (UEL numbers) "key0",..,"key<dim-1>" and one column per field, or of
+    # DataFrames with labels as (Multi)Index if as_frame is True.
+    def get_many(self,names,fields=VALID_FIELDS,as_frame=False):
+        for field in fields:
+            if field not in FIELD_INDEX:
+                raise ValueError("Field type '{}' is not recognised.".format(field))
+        out = {}
+        for name in names:
+            keys,values = self._read_records(name)
+            dtype = [("key{}".format(k),np.int32) for k in range(keys.shape[1])] + \
+                    [(field,np.float64) for field in fields]
+            records = np.empty(keys.shape[0],dtype=dtype)
+            for k in range(keys.shape[1]):
+                records["key{}".format(k)] = keys[:,k]
+            for field in fields:
+                records[field] = values[:,FIELD_INDEX[field]]
+            out[name] = self._records_to_frame(records,keys,fields) if as_frame else records
+        return out
+
+    def _records_to_frame(self,records,keys,fields):
+        import pandas as pd
+        uels = self.get_uels()
+        if keys.shape[1]==0:
+            index = None
+        elif keys.shape[1]==1:
+            index = pd.Index(uels[keys[:,0]])
+        else:
+            index = pd.MultiIndex.from_arrays([uels[keys[:,k]] for k in range(keys.shape[1])])
+        return pd.DataFrame(dict((field,records[field]) for field in fields),index=index,columns=list(fields))
+
+    # Get fields of symbol as DataFrame indexed by labels (MultiIndex for
+    # more than one dimension)
+    def get_frame(self,name,fields=VALID_FIELDS):
+        return self.get_many([name],fields,as_frame=True)[name]
+
+    # Get field of symbol as Series indexed by labels
+    def get_series(self,name,field="level"):
+        return self.get_frame(name,[field])[field]
+
+    # Get field of symbol as dense array with axes ordered as the data of
+    # index_sets. Records with labels not in the sets are left out.
+    def get_dense(self,name,index_sets,field="level",fill_value=0.0):
+        keys,values = self.get_columns(name,field)
+        if keys.shape[1]!=len(index_sets):
+            raise ValueError("Symbol '{}' has {} dimensions, got {} sets.".format(name,keys.shape[1],len(index_sets)))
+        lookups = []
+        for s in index_sets:
+            codes = self.get_uel_numbers(s.data)
+            lookup = -np.ones(len(self.uels),dtype=np.int64)
+            found = codes>0
+            lookup[codes[found]] = np.arange(len(codes))[found]
+            lookups.append(lookup)
+        return gdx_utils.dense_from_records(keys,values,lookups,tuple(len(s.data) for s in index_sets),fill_value)
+
     # Get a list of elements in a set named set_name
     def get_1d_set_elements(self,set_name):
+        if self.lazy:
+            return [key[0] for key in self._read_labeled(set_name,"level",SET_TYPES)[0]]
         try:
-            set_obj = self.db.get_set(set_name)
+            set_obj = self.db.get_symbol(set_name)
         except GamsException as e:
             raise GdxSymbolNotFoundError("A symbol named '{0}' could not be retrieved.\nOrig. msg: {1}".format(set_name,str(e)))
         if not isinstance(set_obj, GamsSet):
@@ -65,8 +219,10 @@ class GdxReader(object):
 
     # Get elements of n-dimensional set as list of n-tuples
     def get_nd_set_elements(self,set_name):
+        if self.lazy:
+            return self._read_labeled(set_name,"level",SET_TYPES)[0]
         try:
-            set_obj = self.db.get_set(set_name)
+            set_obj = self.db.get_symbol(set_name)
         except GamsException as e:
             raise GdxSymbolNotFoundError("A symbol named '{0}' could not be retrieved.\nOrig. msg: {1}".format(set_name,str(e)))
         if not isinstance(set_obj, GamsSet):
@@ -75,10 +231,19 @@ class GdxReader(object):
 
     # Get value of parameter as dict indexed by tuples (key1,..,keyn)
     def get_parameter(self,param_name):
+        if self.lazy:
+            keys,values = self._read_labeled(param_name,"level",[gdxcc.GMS_DT_PAR])
+            if not keys:
+                raise GdxSymbolEmptyError("Symbol {} appears to be empty.".format(param_name))
+            if not keys[0]:
+                return values[0]
+            return dict(zip(keys,values))
         try:
-            param_obj = self.db.get_parameter(param_name)
+            param_obj = self.db.get_symbol(param_name)
         except GamsException as e:
             raise GdxSymbolNotFoundError("A symbol named '{0}' could not be retrieved.\nOrig. msg: {1}".format(param_name,str(e)))
+        if not isinstance(param_obj, GamsParameter):
+            raise TypeError("'{0}' is not a parameter in the current gdx.".format(param_name))
         try:
             if not param_obj.first_record().keys:
                 return param_obj.first_record().value
@@ -88,11 +253,17 @@ class GdxReader(object):
 
     # Get property of equation or variable as dict indexed by tuples (key_1,..,key_n)
     def get_eq_or_var(self,name,field):
+        if self.lazy:
+            if field not in VALID_FIELDS:
+                raise ValueError("Field type is not recognised.")
+            return dict(zip(*self._read_labeled(name,field,[gdxcc.GMS_DT_VAR,gdxcc.GMS_DT_EQU])))
         # Get correct symbol
         try:
             obj = self.db.get_symbol(name)
         except GamsException as e:
             raise GdxSymbolNotFoundError("A symbol named '{0}' could not be retrieved.\nOrig. msg: {1}".format(name,str(e)))
+        if not isinstance(obj, (GamsVariable,GamsEquation)):
+            raise TypeError("'{0}' is not a variable or equation in the current gdx.".format(name))
         # Get correct field
         if field in VALID_FIELDS:
             return dict((tuple(rec.keys),getattr(rec,field)) for rec in obj)
@@ -117,23 +288,21 @@ class GdxReader(object):
     def get_var_lower(self,name):
         return self.get_eq_or_var(name,field="lower")
 
-    # Read symbols and place names in list depending on type
+    # Read symbols and place names in list depending on type (from the
+    # symbol table, no data is loaded)
     def get_symbol_names(self):
         self.param_names = []
         self.set_names = []
         self.var_names = []
         self.eq_names = []
-        for s in GamsIter(self.db):
-            if isinstance(s, GamsParameter):
-                self.param_names.append(s.name)
-            elif isinstance(s, GamsSet):
-                self.set_names.append(s.name)
-            elif isinstance(s, GamsVariable):
-                self.var_names.append(s.name)
-            elif isinstance(s, GamsEquation):
-                self.eq_names.append(s.name)
-            else:
-                raise Exception("Symbol type of '{0}' is not recognised.".format(s.name))
+        names = {gdxcc.GMS_DT_PAR: self.param_names, gdxcc.GMS_DT_SET: self.set_names,
+                 gdxcc.GMS_DT_VAR: self.var_names, gdxcc.GMS_DT_EQU: self.eq_names}
+        if self.symbols is None:
+            self._index_symbols()
+        for symnr,name,dim,sym_type in sorted(self.symbols.values()):
+            # Aliases are skipped
+            if sym_type in names:
+                names[sym_type].append(name)
 
     # Return sets matching a regex pattern
     def find_sets_regex(self,pattern):
@@ -14,10 +14,282 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import threading
 import numpy as np
 cimport numpy as cnp
 
 
+# Default GDX special values (GMS_SV_UNDEF, GMS_SV_NA, GMS_SV_PINF,
+# GMS_SV_MINF, GMS_SV_EPS)
+GDX_UNDF = 1.0E300
+GDX_NA = 2.0E300
+GDX_PINF = 3.0E300
+GDX_MINF = 4.0E300
+GDX_EPS = 5.0E300
+
+
+class LabelRegistry(object):
+    """Registry of labels where each distinct label has an integer code
+    (0, 1, ...) in order of first appearance. Arrays of codes can be stored
+    instead of arrays of strings. Labels are never removed, so a registry
+    should live as long as the sets using it (e.g. one per model). Encoding
+    is thread-safe."""
+    def __init__(self):
+        super(LabelRegistry, self).__init__()
+        self.labels = []
+        self.codes = {}
+        self._label_array = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_lock']
+        state['_label_array'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def label_array(self):
+        """Labels as an object array indexed by code."""
+        if self._label_array is None or len(self._label_array) != len(self.labels):
+            self._label_array = np.array(self.labels, dtype=object)
+        return self._label_array
+
+    def encode(self, labels):
+        """Return int32 array of codes for labels (any shape), registering
+        new labels."""
+        labels = np.asarray(labels).astype(str)
+        if labels.size == 0:
+            return np.zeros(labels.shape, dtype=np.int32)
+        uniq, first, inverse = np.unique(labels.ravel(), return_index=True, return_inverse=True)
+        codes = np.empty(len(uniq), dtype=np.int32)
+        with self._lock:
+            for k in np.argsort(first):
+                label = uniq[k]
+                try:
+                    codes[k] = self.codes[label]
+                except KeyError:
+                    codes[k] = self.codes[label] = len(self.labels)
+                    self.labels.append(label)
+        return codes[inverse].reshape(labels.shape)
+
+    def decode(self, codes):
+        """Return object array of labels for codes."""
+        return self.label_array[np.asarray(codes)]
+
+
+class GdxBulkWriter(object):
+    """Write sets and parameters to a GDX file in raw mode.
+
+    Labels are coded as integers (UEL numbers) once per distinct label and
+    records are collected as integer key arrays and float values, which are
+    written in one pass per symbol on export. Like a GamsDatabase, symbols
+    are added first and then written to file using export."""
+    def __init__(self, system_directory=None):
+        super(GdxBulkWriter, self).__init__()
+        self.system_directory = system_directory
+        self.uels = LabelRegistry()
+        self.code_maps = {}
+        self.symbols = []
+
+    @property
+    def labels(self):
+        return self.uels.labels
+
+    def encode(self, labels):
+        """Return array of UEL numbers for labels, registering new labels in
+        order of first appearance."""
+        return self.uels.encode(labels) + 1
+
+    def encode_codes(self, registry, codes):
+        """Return array of UEL numbers for codes of a LabelRegistry. New
+        labels are registered in the order of their codes."""
+        codes = np.asarray(codes)
+        registry_map = self.code_maps.get(id(registry), (registry, np.zeros(0, dtype=np.int32)))[1]
+        if len(registry_map) < len(registry):
+            registry_map = np.concatenate([registry_map, np.zeros(len(registry)-len(registry_map), dtype=np.int32)])
+        new = np.unique(codes[registry_map[codes] == 0])
+        if new.size:
+            registry_map[new] = self.encode(registry.decode(new))
+        # The registry is kept in the value so that its id is not reused
+        self.code_maps[id(registry)] = (registry, registry_map)
+        return registry_map[codes]
+
+    def add_set(self, name, elements):
+        """Add a set with elements given as a 1d (one-dimensional set) or 2d
+        (one row per element) array of labels."""
+        self.add_set_uels(name, self.encode(elements))
+
+    def add_set_uels(self, name, keys):
+        """Add a set with elements given as a 1d or 2d array of UEL numbers."""
+        keys = np.asarray(keys, dtype=np.int32)
+        if keys.ndim == 1:
+            keys = keys[:, None]
+        self.symbols.append((name, keys.shape[1], False, keys, np.zeros(keys.shape[0])))
+
+    def add_parameter(self, name, index_labels, values=None, zeros_as_eps=False):
+        """Add a parameter from a dense array with one axis per element of
+        index_labels. NaNs are not written, and neither are zeros unless
+        zeros_as_eps is True, in which case they are written as EPS. If
+        values is None, an empty parameter is added."""
+        if values is None:
+            self.add_parameter_uels(name, index_labels)
+        else:
+            self.add_parameter_uels(name, [self.encode(labels) for labels in index_labels], values, zeros_as_eps)
+
+    def add_parameter_uels(self, name, index_uels, values=None, zeros_as_eps=False):
+        """Add a parameter from a dense array with one axis per element of
+        index_uels, arrays of UEL numbers."""
+        dim = len(index_uels)
+        if values is None:
+            self.symbols.append((name, dim, True, np.zeros((0, dim), dtype=np.int32), np.zeros(0)))
+            return
+        values = np.asarray(values, dtype=np.float64).reshape(tuple(len(u) for u in index_uels))
+        flat = values.ravel()
+        keep = ~np.isnan(flat) if zeros_as_eps else (flat != 0) & ~np.isnan(flat)
+        idx = np.flatnonzero(keep)
+        keys = np.empty((len(idx), dim), dtype=np.int32)
+        if dim:
+            coords = np.unravel_index(idx, values.shape)
+            for k, uels in enumerate(index_uels):
+                keys[:, k] = uels[coords[k]]
+        self.symbols.append((name, dim, True, keys, zeros_to_eps(flat[idx]) if zeros_as_eps else flat[idx]))
+
+    def add_parameter_records(self, name, keys, values, zeros_as_eps=False):
+        """Add a parameter from an (n,dim) array of UEL numbers (as returned
+        from encode) and n values. NaNs are not written, zeros are written
+        as EPS if zeros_as_eps is True and left out otherwise."""
+        keys = np.asarray(keys, dtype=np.int32)
+        values = np.asarray(values, dtype=np.float64).ravel()
+        keep = ~np.isnan(values) if zeros_as_eps else (values != 0) & ~np.isnan(values)
+        if not keep.all():
+            keys, values = keys[keep], values[keep]
+        if zeros_as_eps:
+            values = zeros_to_eps(values)
+        self.symbols.append((name, keys.shape[1], True, keys, values))
+
+    def export(self, gdx_file):
+        """Write all added symbols to gdx_file."""
+        import gdxcc
+        h = new_gdx_handle(gdxcc, self.system_directory)
+        try:
+            if not gdxcc.gdxOpenWrite(h, gdx_file, "gamspy")[0]:
+                raise GdxWriteError("Could not open '{}' for writing.".format(gdx_file))
+            gdxcc.gdxUELRegisterRawStart(h)
+            for label in self.labels:
+                gdxcc.gdxUELRegisterRaw(h, label)
+            gdxcc.gdxUELRegisterDone(h)
+            for name, dim, is_param, keys, values in self.symbols:
+                if keys.shape[0] > 1:
+                    order = np.lexsort(keys.T[::-1])
+                    keys, values = keys[order], values[order]
+                write_raw_records(h, gdxcc, name, dim,
+                                  gdxcc.GMS_DT_PAR if is_param else gdxcc.GMS_DT_SET,
+                                  keys, to_gdx_values(values))
+            gdxcc.gdxClose(h)
+        finally:
+            gdxcc.gdxFree(h)
+
+
+class GdxError(Exception):
+    pass
+
+class GdxWriteError(GdxError):
+    pass
+
+
+cpdef object new_gdx_handle(object gdxcc, object system_directory=None):
+    """Create a GDX handle, using the GDX library in system_directory if
+    given."""
+    h = gdxcc.new_gdxHandle_tp()
+    if system_directory:
+        rc, msg = gdxcc.gdxCreateD(h, system_directory, gdxcc.GMS_SSSIZE)
+    else:
+        rc, msg = gdxcc.gdxCreate(h, gdxcc.GMS_SSSIZE)
+    if not rc:
+        raise GdxError("Could not load GDX library: {}".format(msg))
+    return h
+
+
+cpdef cnp.ndarray to_gdx_values(cnp.ndarray values):
+    """Replace infinite values with GDX special values."""
+    if np.isinf(values).any():
+        values = np.where(values == np.inf, GDX_PINF, np.where(values == -np.inf, GDX_MINF, values))
+    return values
+
+cpdef cnp.ndarray zeros_to_eps(cnp.ndarray values):
+    """Replace zeros with EPS, so that they are kept as records in GAMS."""
+    return np.where(values == 0, GDX_EPS, values)
+
+cpdef cnp.ndarray from_gdx_values(cnp.ndarray values):
+    """Replace GDX special values with inf, -inf, 0 (EPS) or NaN (UNDF/NA)."""
+    special = values >= GDX_UNDF
+    if special.any():
+        values = values.copy()
+        values[values == GDX_PINF] = np.inf
+        values[values == GDX_MINF] = -np.inf
+        values[values == GDX_EPS] = 0.0
+        values[(values == GDX_UNDF) | (values == GDX_NA)] = np.nan
+    return values
+
+cpdef tuple read_raw_records(object h, object gdxcc, int symnr, int dim):
+    """Read all records of a symbol in raw mode. Return keys as an (n,dim)
+    array of UEL numbers and an (n,GMS_VAL_MAX) array of values (level,
+    marginal, lower, upper, scale)."""
+    cdef int rc, nrecs, r, k
+    cdef int nvals = gdxcc.GMS_VAL_MAX
+    rc, nrecs = gdxcc.gdxDataReadRawStart(h, symnr)
+    if not rc:
+        raise GdxError("Could not read symbol number {}.".format(symnr))
+    cdef cnp.ndarray[cnp.int32_t, ndim=2] keys = np.empty((nrecs, dim), dtype=np.int32)
+    cdef cnp.ndarray[cnp.float64_t, ndim=2] values = np.empty((nrecs, nvals), dtype=np.float64)
+    cdef object rec_keys, rec_values
+    for r in range(nrecs):
+        rc, rec_keys, rec_values, _ = gdxcc.gdxDataReadRaw(h)
+        for k in range(dim):
+            keys[r, k] = rec_keys[k]
+        for k in range(nvals):
+            values[r, k] = rec_values[k]
+    gdxcc.gdxDataReadDone(h)
+    return keys, from_gdx_values(values)
+
+cpdef cnp.ndarray dense_from_records(cnp.ndarray keys, cnp.ndarray values, list lookups, tuple shape, object fill_value=0.0):
+    """Scatter records into a dense array of given shape. lookups[k] maps UEL
+    numbers in column k of keys to positions along axis k (-1 if not
+    included)."""
+    cdef cnp.ndarray out = np.empty(shape, dtype=np.float64)
+    out.fill(fill_value)
+    if not lookups:
+        if values.shape[0]:
+            out[()] = values[0]
+        return out
+    pos = np.column_stack([lookup[keys[:, k]] for k, lookup in enumerate(lookups)])
+    keep = (pos >= 0).all(axis=1)
+    out[tuple(pos[keep].T)] = values[keep]
+    return out
+
+cpdef write_raw_records(object h, object gdxcc, str name, int dim, int sym_type,
+                        cnp.ndarray keys, cnp.ndarray[cnp.float64_t, ndim=1] values):
+    """Write one symbol in raw mode. Keys must be sorted UEL numbers."""
+    cdef cnp.int64_t r, n = values.shape[0]
+    cdef int level = gdxcc.GMS_VAL_LEVEL
+    cdef list key_rows = keys.tolist()
+    cdef object vals = gdxcc.doubleArray(gdxcc.GMS_VAL_MAX)
+    if not gdxcc.gdxDataWriteRawStart(h, name, "", dim, sym_type, 0):
+        raise GdxWriteError("Could not start writing symbol '{}'.".format(name))
+    for r in range(n):
+        vals[level] = values[r]
+        gdxcc.gdxDataWriteRaw(h, key_rows[r], vals)
+    if not gdxcc.gdxDataWriteDone(h):
+        raise GdxWriteError("Error when writing symbol '{}'.".format(name))
+
+
 cpdef object set_from_1d_array(object db,char* name,cnp.ndarray elements):
     cdef object out_set = db.add_set(name,1,"")
     cdef object element
@@ -48,6 +320,18 @@ cpdef object param_from_1d_array(object db,char* name,cnp.ndarray set_list,cnp.n
         out_param.add_record((set_list[i],)).value = val
     return out_param
 
+cpdef object param_from_coords(object db,char* name,list index_labels,tuple coords,cnp.ndarray[cnp.float64_t, ndim=1] values):
+    cdef object out_param = db.add_parameter(name,len(index_labels),"")
+    return add_coord_records(out_param,index_labels,coords,values)
+
+cpdef object add_coord_records(object out_param,list index_labels,tuple coords,cnp.ndarray[cnp.float64_t, ndim=1] values):
+    cdef cnp.int64_t r
+    cdef int k
+    for r in range(values.shape[0]):
+        if values[r] != 0:
+            out_param.add_record(tuple([index_labels[k][coords[k][r]] for k in range(len(index_labels))])).value = values[r]
+    return out_param
+
 
 cpdef dict parse_along(dict to_parse, list args_keep, list arg_parsealong):
     cdef dict out = {}
@@ -55,41 +339,45 @@ cpdef dict parse_along(dict to_parse, list args_keep, list arg_parsealong):
     cdef cnp.int64_t i
     cdef cnp.ndarray tmp
     for key in args_keep:
-        tmp = cnp.zeros((len(arg_parsealong),1))
+        tmp = np.zeros((len(arg_parsealong),1))
         for i,parsed_arg in enumerate(arg_parsealong):
             tmp[i] = to_parse[(key,parsed_arg)]
         out[key] = tmp
     return out
 
-cpdef cnp.ndarray parse_along_1d(dict to_parse, list args):
-    cdef cnp.int64_t i,j
-    cdef cnp.float64_t dummy
-    cdef cnp.ndarray tmp = np.zeros((len(args),1))
-    for (i,j),dummy in np.ndenumerate(tmp):
-        try:
-            tmp[i,0] = to_parse[(args[i],)]
-        except KeyError as e:
-            pass
-    return tmp
+cpdef cnp.ndarray label_positions(labels, keys):
+    """Return position of each key in labels (-1 if missing), using a
+    sorted copy of labels instead of a lookup per record."""
+    cdef cnp.ndarray labels_arr = np.asarray(labels, dtype=object).astype(str)
+    cdef cnp.ndarray keys_arr = np.asarray(keys, dtype=object).astype(str)
+    if len(labels_arr) == 0:
+        return np.full(len(keys_arr), -1, dtype=np.int64)
+    cdef cnp.ndarray order = np.argsort(labels_arr, kind='mergesort')
+    cdef cnp.ndarray sorted_labels = labels_arr[order]
+    cdef cnp.ndarray pos = np.searchsorted(sorted_labels, keys_arr)
+    pos[pos == len(labels_arr)] = 0
+    return np.where(sorted_labels[pos] == keys_arr, order[pos], -1).astype(np.int64)
 
-cpdef cnp.ndarray parse_along_2d(dict to_parse, list args1, list args2):
-    cdef cnp.int64_t i,j
-    cdef cnp.float64_t dummy
-    cdef cnp.ndarray tmp = np.zeros((len(args1),len(args2)))
-    for (i,j),dummy in np.ndenumerate(tmp):
-        try:
-            tmp[i,j] = to_parse[(args1[i],args2[j])]
-        except KeyError as e:
-            pass
-    return tmp
-
-cpdef cnp.ndarray parse_along_nd(dict to_parse, tuple arg_lists):
-    cdef tuple idxs
-    cdef cnp.float64_t dummy
-    cdef cnp.ndarray tmp = np.zeros(tuple(map(len,arg_lists)))
-    for idxs,dummy in np.ndenumerate(tmp):
-        try:
-            tmp[idxs] = to_parse[tuple([arg_list[i] for i,arg_list in zip(idxs,arg_lists)])]
-        except KeyError as e:
-            pass
-    return tmp
\ No newline at end of file
+cpdef cnp.ndarray dense_from_dict(dict to_parse, arg_lists, fill_value=0., dtype=np.float64):
+    """Scatter tuple-keyed values in to_parse into an array with one axis per
+    list in arg_lists. Keys not in arg_lists are skipped and cells without a
+    key get fill_value. Cost grows with the number of records."""
+    cdef cnp.ndarray out = np.full(tuple(map(len, arg_lists)), fill_value, dtype=dtype)
+    if not to_parse or out.size == 0:
+        return out
+    cdef cnp.ndarray key_arr = np.empty((len(to_parse), len(arg_lists)), dtype=object)
+    key_arr[:] = list(to_parse.keys())
+    cdef cnp.ndarray values = np.fromiter(to_parse.values(), dtype=dtype, count=len(to_parse))
+    cdef list idx = [label_positions(arg_list, key_arr[:, d]) for d, arg_list in enumerate(arg_lists)]
+    cdef cnp.ndarray found = np.logical_and.reduce([i >= 0 for i in idx])
+    out[tuple([i[found] for i in idx])] = values[found]
+    return out
+
+cpdef cnp.ndarray parse_along_1d(dict to_parse, list args, fill_value=0., dtype=np.float64):
+    return dense_from_dict(to_parse, (args,), fill_value, dtype)[:, None]
+
+cpdef cnp.ndarray parse_along_2d(dict to_parse, list args1, list args2, fill_value=0., dtype=np.float64):
+    return dense_from_dict(to_parse, (args1, args2), fill_value, dtype)
+
+cpdef cnp.ndarray parse_along_nd(dict to_parse, tuple arg_lists, fill_value=0., dtype=np.float64):
+    return dense_from_dict(to_parse, arg_lists, fill_value, dtype)
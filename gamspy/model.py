@@ -15,13 +15,30 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 import os
+import shutil
+import contextlib
 import operator
+from distutils.spawn import find_executable
+import numpy as np
 import jinja2
 import gams
 import re
 import gdx_utils as gdx
 from .types import *
 import utils
+import size
+import profiling
+from gdx import get_reader
+
+# Solver option file settings for using a start point, by solver
+WARM_START_SETTINGS = {
+    "cplex": {"advind": 1, "mipstart": 1},
+    "gurobi": {"mipstart": 1},
+}
+MIP_MODEL_TYPES = ["mip","miqcp","minlp"]
+# Timings and counts written by GAMS to the status file
+GAMS_STATS = ["timecomp","timeexec","timeelapsed","resgen","resusd","etsolve","etsolver",
+              "iterusd","numequ","numvar","numnz","heapsize"]
 
 class GamspyModel(object):
     """Class that contains necessary data to run a GAMS model"""
@@ -50,6 +67,16 @@ class GamspyModel(object):
         self.data_file = self._work_file(data_file,"{}_input.gdx".format(self.name))
         self.out_file = self._work_file(out_file,"{}_output.gdx".format(self.name))
         self.status_file = self._work_file(status_file,"{}_statuses.txt".format(self.name))
+        # Model structure file and GAMS work file (without .g00) for save/restart
+        self.save_model_file = self._work_file(None,"{}_save.gms".format(self.name))
+        self.save_file = self._work_file(None,"{}_save".format(self.name))
+        # Set by save_model, runs then restart from save_file
+        self.restart_file = None
+        # Solution GDX loaded before solving, set by warm_start
+        self.warm_start_file = None
+        # Option and opt file values replaced by warm_start, restored by
+        # clear_warm_start, by (dict name, key)
+        self._cold_settings = {}
 
         self.accept_codes = {"solvestat": [1], "modelstat": [1,8]}
 
@@ -73,6 +100,12 @@ class GamspyModel(object):
 
         self.opt_file = os.path.join(self.work_dir,self.solver+".opt")
         self.template_dirs = [os.path.join(os.path.dirname(__file__), 'templates')]
+        # Directory for on-disk cache of compiled templates (optional)
+        self.bytecode_cache_dir = None
+
+        # Set element labels of this model. Sets can be created with
+        # registry=model.registry, others are moved to it when data is written
+        self.registry = gdx.LabelRegistry()
 
         self.sets = {}
         self.aliases = {}
@@ -84,34 +117,191 @@ class GamspyModel(object):
         self.presolve_assign = []
         self.dump = True
 
+        # Optional cache.SolveCache used by run_model
+        self.cache = None
+        # Limits on estimated "rows", "columns", "nonzeros" and "memory"
+        # (bytes), checked before GAMS is started
+        self.size_limits = {}
+        # Timings and counts by phase, see profiling.GamspyProfile
+        self.profile = profiling.GamspyProfile()
+
         self.header_string = """*-----------------------------------------------------------------------------
 * This file has been automatically rendered by gamspy
 *-----------------------------------------------------------------------------
 """
 
-    def run_model(self):
-        self.statuses = {}
+    def run_model(self,timeout=None,log_callbacks=None):
+        """Run GAMS and read statuses. If timeout is given, GAMS is killed
+        after timeout seconds and GamspyTimeoutError is raised. See
+        utils.start_gams for log_callbacks.
+
+        If self.cache is set and the model file, data, options and solver
+        are the same as for a cached run, the cached output and statuses are
+        used without running GAMS."""
+        if self.cache is None:
+            self.start_model(timeout=timeout,log_callbacks=log_callbacks).result()
+            return
+        key = self.cache_key()
+        cached_files = {"out.gdx": self.out_file, "statuses.txt": self.status_file}
+        if self.cache.get(key,cached_files):
+            print "Using cached result for {}.".format(self.name)
+            self.read_statuses()
+            return
+        run = self.start_model(timeout=timeout,log_callbacks=log_callbacks)
+        run.result()
+        # Runs stopped early by a log callback are not the model's solution
+        if not run.job.interrupted:
+            self.cache.put(key,cached_files)
+
+    def cache_key(self):
+        """Key of the written model and data files and settings for
+        self.cache. Paths to the work dir are left out of the model file."""
+        with open(self.model_file,'r') as f:
+            model_text = f.read().replace(utils.fix_path(self.work_dir),'').replace(self.work_dir,'')
+        texts = [model_text]
+        if self.opt_settings and os.path.isfile(self.opt_file):
+            with open(self.opt_file,'r') as f:
+                texts.append(f.read())
+        # Results from another GAMS installation are not reused
+        gams_exec = self.gams_exec or "gams"
+        gams_exec = os.path.realpath(find_executable(gams_exec) or gams_exec)
+        settings = [self.options,self.model_options,self.opt_settings,
+                    {"solver": self.solver,"model_type": self.model_type,"gams_exec": gams_exec}]
+        files = [self.data_file]
+        if self.warm_start_file:
+            files.append(self.warm_start_file)
+        if self.restart_file:
+            files.append(self.restart_file+'.g00')
+        return self.cache.make_key(files=files,texts=texts,settings=settings)
+
+    def start_model(self,timeout=None,log_callbacks=None):
+        """Start GAMS without waiting for it to finish. Returns a
+        GamspyModelRun, on which result() waits and reads statuses."""
+        self.check_size()
+        gams_args = ['r',utils.fix_path(self.restart_file)] if self.restart_file else None
+        job = utils.start_gams(model_file=self.model_file,work_dir=self.work_dir,gams_exec=self.gams_exec,
+                                timeout=timeout,log_callbacks=log_callbacks,gams_args=gams_args)
+        return GamspyModelRun(self,job)
+
+    def save_model(self,template='save_gms.j2',timeout=None):
+        """Compile sets, parameter declarations, variables, equations and the
+        model statement once (loading the current data file) and save them
+        to a GAMS work file. Later model files are rendered with
+        restart_gms.j2 and run restarted from the work file, so they only
+        load parameter data, set limits and solve. Call again if sets or
+        equations change, or clear_restart to go back to full runs."""
+        self.check_size()
+        env = utils.get_j2_environment(self.template_dirs,self.bytecode_cache_dir)
+        with open(self.save_model_file,'w') as f:
+            f.write(self.header_string+env.get_template(template).render(self.template_context()))
+        utils.run_gams(model_file=self.save_model_file,work_dir=self.work_dir,gams_exec=self.gams_exec,
+                        timeout=timeout,gams_args=['s',utils.fix_path(self.save_file)])
+        self.restart_file = self.save_file
+
+    def warm_start(self,out_file=None,basis=True):
+        """Start the next runs from the solution in out_file (by default the
+        output of the last run), which is copied to the work dir and loaded
+        with EXECUTE_LOADPOINT before the solve. Levels and marginals of
+        variables and equations with the same names are used. If basis is
+        True, GAMS is told to pass them to the solver as an advanced basis
+        and the solver settings in WARM_START_SETTINGS (MIP start for MIP
+        models) are added to opt_settings."""
+        start_file = self._work_file(None,"{}_start.gdx".format(self.name))
+        shutil.copyfile(out_file if out_file else self.out_file,start_file)
+        self.warm_start_file = start_file
+        if basis:
+            self._set_warm_setting("options","bratio",0)
+            settings = WARM_START_SETTINGS.get(self.solver,{})
+            keys = ["mipstart"] if self.model_type in MIP_MODEL_TYPES else []
+            keys.append("advind")
+            for key in keys:
+                if key in settings:
+                    self._set_warm_setting("opt_settings",key,settings[key])
+
+    def clear_warm_start(self):
+        """Start solves without a previous solution, restoring the options
+        and solver settings changed by warm_start."""
+        self.warm_start_file = None
+        for (attr,key),(was_set,old) in self._cold_settings.items():
+            settings = getattr(self,attr)
+            if was_set:
+                settings[key] = old
+            else:
+                settings.pop(key,None)
+        self._cold_settings = {}
+
+    def _set_warm_setting(self,attr,key,value):
+        settings = getattr(self,attr)
+        self._cold_settings.setdefault((attr,key),(key in settings,settings.get(key)))
+        settings[key] = value
 
-        utils.run_gams(model_file=self.model_file,work_dir=self.work_dir,gams_exec=self.gams_exec)
+    def clear_restart(self):
+        """Run the full model file again instead of restarting."""
+        self.restart_file = None
+
+    def read_statuses(self,interrupted=False):
+        """Read statuses written by GAMS. If the solve was interrupted, a
+        solver status of 8 (user interrupt) is also accepted. Timings and
+        counts in GAMS_STATS are recorded in self.profile.gams."""
+        self.statuses = {}
+        stats = {}
+        accept_codes = dict(self.accept_codes)
+        if interrupted:
+            accept_codes["solvestat"] = accept_codes["solvestat"] + [8]
 
         # Read status codes from returns file
         with open(self.status_file,'r') as f:
             for line in f:
                 key,status = line.split(',')
+                if key in GAMS_STATS:
+                    stats[key] = float(status)
+                    continue
                 m = re.match('(\d+)\s([\w ]+)',status)
                 self.statuses[key] = (int(float(m.group(1))),m.group(2))
+        if stats:
+            self.profile.record_gams(stats)
 
         # Raise exception if status codes are not acceptable
         status_str = ""
         for key,(code,status) in self.statuses.items():
-            if code not in self.accept_codes[key]:
-                raise GamspyExecutionError("Unacceptable status code from GAMS. {} is {}: '{}'.".format(key,code,status))
+            if code not in accept_codes[key]:
+                raise utils.GamspyExecutionError("Unacceptable status code from GAMS. {} is {}: '{}'.".format(key,code,status))
             status_str += "{} is {}: '{}'. ".format(key,code,status)
         print "{}\nGAMS finished without errors.".format(status_str)
 
-    def write_data_file(self):
+    def instantiate(self,modifiable,template='instance_gms.j2'):
+        """Generate the model once as a GAMS model instance that can be solved
+        repeatedly from Python. modifiable is a list of parameters (or
+        parameter names) that can be changed with update() on the returned
+        GamspyModelInstance. The data file must have been written."""
+        self.check_size()
+        ws = gams.GamsWorkspace(working_directory=self.work_dir)
+        instance_file = self._work_file(None,"{}_instance.gms".format(self.name))
+        env = utils.get_j2_environment(self.template_dirs,self.bytecode_cache_dir)
+        with open(instance_file,'w') as f:
+            f.write(self.header_string+env.get_template(template).render(self.template_context()))
+        checkpoint = ws.add_checkpoint()
+        ws.add_job_from_file(instance_file).run(checkpoint=checkpoint)
+        return GamspyModelInstance(self,ws,checkpoint,modifiable)
+
+    def write_data_file(self,bulk=True):
+        with self.profile.phase("write_data") as metrics:
+            db = self._write_data_file(bulk)
+            if bulk:
+                metrics["records"] = sum(len(symbol[3]) for symbol in db.symbols)
+            else:
+                metrics["records"] = sum(symbol.number_records for symbol in db)
+            metrics["bytes"] = os.path.getsize(self.data_file)
+
+    def _write_data_file(self,bulk):
         ws = gams.GamsWorkspace()
-        db = ws.add_database()
+        # Write with integer-coded labels in raw mode unless bulk is False,
+        # in which case records are added one by one through a GamsDatabase
+        if bulk:
+            db = gdx.GdxBulkWriter(ws.system_directory)
+        else:
+            db = ws.add_database()
+        self.recode_sets()
         for s in sorted(self.sets.values(), key=operator.attrgetter('level')):
             print "Adding set: {}".format(s.name)
             try:
@@ -119,7 +309,7 @@ class GamspyModel(object):
             except Exception:
                 print s
                 raise
-        for p in self.parameters.values():
+        for p in self.all_parameters().values():
             print "Adding parameter: {}".format(p.name)
             try:
                 p.add_to_db(db)
@@ -127,21 +317,91 @@ class GamspyModel(object):
                 print p
                 raise
         db.export(self.data_file)
+        return db
 
-    def write_model_file(self,template='base_gms.j2',optfile_template='base_optfile.j2'):
-        env = jinja2.Environment(loader=jinja2.FileSystemLoader(self.template_dirs))
-        env.filters.update(utils.j2env['filters'])
-        env.tests.update(utils.j2env['tests'])
-        env.globals.update(utils.j2env['globals'])
+    def write_model_file(self,template=None,optfile_template='base_optfile.j2',stream=False):
+        """Render model and solver option files. If stream is True, the model
+        file is written in chunks as it is rendered instead of being rendered
+        to one string first. template defaults to restart_gms.j2 after
+        save_model and base_gms.j2 otherwise."""
+        with self.profile.phase("write_model") as metrics:
+            self._write_model_file(template,optfile_template,stream)
+            metrics["bytes"] = os.path.getsize(self.model_file)
+
+    def _write_model_file(self,template,optfile_template,stream):
+        env = utils.get_j2_environment(self.template_dirs,self.bytecode_cache_dir)
+        if template is None:
+            template = 'restart_gms.j2' if self.restart_file else 'base_gms.j2'
 
         template = env.get_template(template)
         opt_template = env.get_template(optfile_template)
 
         with open(self.model_file,'w') as f:
-            f.write(self.header_string+template.render(self.__dict__))
+            if stream:
+                f.write(self.header_string)
+                template_stream = template.stream(self.template_context())
+                template_stream.enable_buffering(size=100)
+                template_stream.dump(f)
+            else:
+                f.write(self.header_string+template.render(self.template_context()))
         with open(self.opt_file,'w') as f:
             f.write(self.header_string+opt_template.render({"settings":self.opt_settings}))
 
+    def set_work_dir(self,work_dir):
+        """Move model, data, output, status and option files to work_dir."""
+        if not os.path.isdir(work_dir):
+            raise ValueError("The given work dir '{}' is not a directory.".format(work_dir))
+        for attr in ['model_file','data_file','out_file','status_file','opt_file','save_model_file','save_file']:
+            setattr(self,attr,os.path.join(work_dir,os.path.basename(getattr(self,attr))))
+        self.work_dir = work_dir
+
+    @contextlib.contextmanager
+    def read_results(self,lazy=True):
+        """GdxReader of out_file for use in a with-statement. The time spent
+        in the with-block is recorded as phase read_results."""
+        with self.profile.phase("read_results",bytes=os.path.getsize(self.out_file)):
+            with get_reader(self.out_file,lazy=lazy) as r:
+                yield r
+
+    def recode_sets(self):
+        """Move sets created with another label registry to self.registry."""
+        for s in self.sets.values():
+            s.set_registry(self.registry)
+
+    def estimate_size(self):
+        """Estimate rows, columns, nonzeros and memory use of the generated
+        model, see size.estimate_size."""
+        return size.estimate_size(self)
+
+    def check_size(self):
+        """Raise size.GamspySizeLimitError if the estimated model size
+        exceeds self.size_limits."""
+        if self.size_limits:
+            size.check_limits(self.estimate_size(),self.size_limits)
+
+    def add_sparsity_subset(self,name,source,indices=None):
+        """Create a subset where source (a parameter or a boolean mask over
+        indices) is nonzero with types.sparsity_subset, add it to the model
+        sets so that it is exported, and return it for use as condition on
+        equations and sums."""
+        subset = sparsity_subset(name,source,indices)
+        self.sets[name] = subset
+        return subset
+
+    def all_parameters(self):
+        """Parameters including those holding per-index variable limits."""
+        params = dict(self.parameters)
+        for var in self.variables.values():
+            for lim_param in var.lim_params.values():
+                params[lim_param.name] = lim_param
+        return params
+
+    def template_context(self):
+        """Variables available in model templates."""
+        context = dict(self.__dict__)
+        context["parameters"] = self.all_parameters()
+        return context
+
     def _work_file(self,filename,default):
         if not filename:
             return os.path.join(self.work_dir,default)
@@ -149,3 +409,107 @@ class GamspyModel(object):
             return os.path.join(self.work_dir,filename)
 
 
+class GamspyModelRun(object):
+    """A GAMS run of a model that has been started but may not have finished."""
+    def __init__(self, model, job):
+        super(GamspyModelRun, self).__init__()
+        self.model = model
+        self.job = job
+
+    def done(self):
+        return self.job.done()
+
+    def cancel(self):
+        """Kill GAMS and any solver processes it has started."""
+        self.job.cancel()
+
+    def interrupt(self):
+        """Stop the solve early, keeping the best solution found."""
+        self.job.interrupt()
+
+    def result(self,timeout=None):
+        """Wait for GAMS to finish (at most timeout seconds, if given), check
+        the return code and status codes and return the statuses."""
+        self.job.result(timeout)
+        self.model.profile.record("gams",time=self.job.elapsed,
+                                  peak_memory=profiling.rusage_memory(self.job.rusage))
+        with self.model.profile.phase("read_statuses"):
+            self.model.read_statuses(interrupted=self.job.interrupted)
+        return self.model.statuses
+
+
+class GamspyModelInstance(object):
+    """A model generated once by GAMS and kept in memory, for solving again
+    after changing modifiable parameters without writing files or starting
+    a new GAMS process."""
+    def __init__(self, model, workspace, checkpoint, modifiable):
+        super(GamspyModelInstance, self).__init__()
+        self.model = model
+        self.workspace = workspace
+        self.instance = checkpoint.add_modelinstance()
+        self.modifiable = {}
+        modifiers = []
+        for p in modifiable:
+            p = model.parameters[p] if isinstance(p,basestring) else p
+            self.modifiable[p.name] = p
+            gams_param = self.instance.sync_db.add_parameter(p.name,p.ndim,"")
+            modifiers.append(gams.GamsModifier(gams_param))
+        opt = workspace.add_options()
+        opt.all_model_types = model.solver
+        model_def = "{} using {} {} {}".format(model.name,model.model_type,
+                        "maximizing" if model.maximize else "minimizing",model.obj_var.name)
+        self.instance.instantiate(model_def,modifiers,opt)
+        self.statuses = {}
+
+    def update(self,**data):
+        """Set new data for modifiable parameters by name, given as arrays
+        with the shape of the parameter (or anything accepted as parameter
+        data). The new data is used from the next solve()."""
+        for name,values in data.items():
+            if name not in self.modifiable:
+                raise ValueError("Parameter '{}' is not modifiable in this instance.".format(name))
+            p = self.modifiable[name]
+            p.data = values
+            gams_param = self.instance.sync_db.get_parameter(name)
+            gams_param.clear()
+            # Entries without a record are zero when solving (NaN is left
+            # out instead of being loaded as UNDF)
+            if p.ndim == 0:
+                if not np.isnan(p.data):
+                    gams_param.add_record().value = float(p.data)
+                continue
+            coords,values = p.records()
+            if p.zeros_as_eps:
+                values = np.where(values==0,self.workspace.my_eps,values)
+            gdx.add_coord_records(gams_param,[list(ind.data) for ind in p.indices],coords,values)
+
+    def solve(self):
+        """Solve the model instance with the current data and check status
+        codes as in GamspyModel.read_statuses. Returns the statuses."""
+        with self.model.profile.phase("instance_solve"):
+            # Modifiable parameters without a record are zero, not their
+            # values at instantiation (the default BaseCase update type)
+            self.instance.solve(update_type=gams.SymbolUpdateType.Zero)
+        codes = {"modelstat": int(self.instance.model_status),
+                 "solvestat": int(self.instance.solver_status)}
+        self.statuses = {}
+        for key,code in codes.items():
+            self.statuses[key] = (code,"")
+            if code not in self.model.accept_codes[key]:
+                raise utils.GamspyExecutionError("Unacceptable status code from GAMS. {} is {}.".format(key,code))
+        return self.statuses
+
+    def get_variable(self,name,field="level"):
+        """Return field of variable from the last solve as an array with one
+        axis per index set (a float for scalar variables)."""
+        return self._get_dense(self.instance.sync_db.get_variable(name),self.model.variables[name],field)
+
+    def get_equation(self,name,field="level"):
+        """Return field of equation from the last solve, see get_variable."""
+        return self._get_dense(self.instance.sync_db.get_equation(name),self.model.equations[name],field)
+
+    def _get_dense(self,symbol,element,field):
+        records = dict((tuple(rec.keys),getattr(rec,field)) for rec in symbol)
+        if not element.indices:
+            return records.values()[0] if records else 0.0
+        return gdx.parse_along_nd(records,tuple(list(ind.data) for ind in element.indices))
@@ -0,0 +1,127 @@
+# gamspy - Build and run GAMS models from Python
+# Copyright (C) 2014 Joel Goop
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# USAGE
+#
+# Each GamspyModel has a GamspyProfile in model.profile, which is filled as
+# the model is written, run and read:
+#
+#    model.profile.hooks.append(lambda phase,metrics: statsd.send(phase,metrics))
+#    model.write_data_file(); model.write_model_file(); model.run_model()
+#    print model.profile.report()
+#
+# GAMS-side timings (compilation, generation, solver) are read with the
+# statuses and found in model.profile.gams.
+import sys
+import time
+import contextlib
+from collections import OrderedDict
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+def peak_memory(children=False):
+    """Peak resident memory in bytes of this process, or None if it cannot
+    be measured. If children is True, the largest peak of all child
+    processes waited for during the lifetime of this process is returned
+    instead, which never decreases between runs."""
+    if resource is None:
+        return None
+    return rusage_memory(resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF))
+
+def rusage_memory(usage):
+    """Peak resident memory in bytes from a resource usage (e.g. of one
+    process, as given by os.wait4), or None if usage is None."""
+    if usage is None:
+        return None
+    # ru_maxrss is in bytes on OS X and kilobytes elsewhere
+    return usage.ru_maxrss if sys.platform=='darwin' else usage.ru_maxrss*1024
+
+
+class GamspyProfile(object):
+    """Metrics by phase (time in seconds, peak memory and counts such as
+    bytes and records). Each hook is called with phase name and metrics
+    dict when a phase is recorded.
+
+    Peak memory is that of the Python process so far, except for phase
+    "gams", where it is that of the GAMS process (and its solvers) of the
+    run.
+
+    Hooks are not pickled (they are often lambdas), so a model sent to
+    worker processes, e.g. by scenarios.ScenarioRunner, runs without them."""
+    def __init__(self, hooks=None):
+        super(GamspyProfile, self).__init__()
+        self.phases = OrderedDict()
+        self.gams = {}
+        self.hooks = list(hooks) if hooks else []
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["hooks"] = []
+        return state
+
+    @contextlib.contextmanager
+    def phase(self,name,**counts):
+        """Time the with-block as phase name. Counts can be given here or
+        added to the yielded dict."""
+        metrics = dict(counts)
+        start = time.time()
+        yield metrics
+        metrics["time"] = time.time()-start
+        self.record(name,**metrics)
+
+    def record(self,name,**metrics):
+        """Record metrics of phase name, adding time if phase is repeated."""
+        metrics.setdefault("peak_memory",peak_memory())
+        if name in self.phases and "time" in metrics:
+            metrics["time"] += self.phases[name].get("time",0.0)
+        self.phases[name] = metrics
+        for hook in self.hooks:
+            hook(name,metrics)
+
+    def record_gams(self,stats):
+        """Record timings and counts reported by GAMS."""
+        self.gams = dict(stats)
+        for hook in self.hooks:
+            hook("gams_stats",self.gams)
+
+    def clear(self):
+        self.phases.clear()
+        self.gams = {}
+
+    def as_dict(self):
+        return {"phases": dict((name,dict(m)) for name,m in self.phases.items()),
+                "gams": dict(self.gams)}
+
+    def report(self):
+        """Return a table of phases and GAMS statistics."""
+        lines = ["{:<16}{:>10}{:>14}{:>12}{:>14}".format("phase","time (s)","bytes","records","peak mem (MB)")]
+        for name,m in self.phases.items():
+            lines.append("{:<16}{:>10}{:>14}{:>12}{:>14}".format(name,_fmt(m.get("time"),"{:.3f}"),
+                            _fmt(m.get("bytes")),_fmt(m.get("records")),
+                            _fmt(m.get("peak_memory") and m["peak_memory"]/2.**20,"{:.1f}")))
+        if self.gams:
+            lines.append("")
+            lines.append("GAMS: " + ", ".join("{} = {}".format(k,v) for k,v in sorted(self.gams.items())))
+        return "\n".join(lines)
+
+
+def _fmt(value,spec="{}"):
+    return "-" if value is None else spec.format(value)
@@ -0,0 +1,237 @@
+# gamspy - Build and run GAMS models from Python
+# Copyright (C) 2014 Joel Goop
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# USAGE
+#
+# Variants of a model are described by GamspyScenario objects and run in
+# parallel, each in its own subdirectory of work_dir:
+#
+#    runner = ScenarioRunner(model,[
+#                GamspyScenario('low',parameters={'a': [300,500]}),
+#                GamspyScenario('high',parameters={'a': [400,700]})
+#             ],work_dir=d,processes=2)
+#    results = runner.run()
+#    print results['low'].statuses
+#
+# On Windows, code starting the runner must be protected by
+# "if __name__ == '__main__':" since worker processes import the main module.
+#
+# Many variants that only differ in parameter data can instead be solved in
+# a loop in one GAMS job, with data given by arrays with a leading scenario
+# axis:
+#
+#    batch = ScenarioBatch(model,{'a': np.array([[300,500],[400,700]])},
+#                          names=['low','high'])
+#    result = batch.run()
+#    x_l = result.get_variable('x')   # shape (2,len(i),len(j))
+import os
+import copy
+import traceback
+import multiprocessing
+import numpy as np
+from .types import GamspySet, GamspyParameter
+import utils
+
+
+class GamspyScenario(object):
+    """Overrides of parameter data and options for one run of a model."""
+    def __init__(self, name, parameters=None, options=None, model_options=None, opt_settings=None):
+        super(GamspyScenario, self).__init__()
+        self.name = name
+        self.parameters = parameters if parameters else {}
+        self.options = options if options else {}
+        self.model_options = model_options if model_options else {}
+        self.opt_settings = opt_settings if opt_settings else {}
+
+    def apply(self,model):
+        """Apply overrides to model (parameters are given by model key)."""
+        for key,data in self.parameters.items():
+            model.parameters[key].data = data
+        model.options.update(self.options)
+        model.model_options.update(self.model_options)
+        model.opt_settings.update(self.opt_settings)
+
+
+class GamspyScenarioResult(object):
+    """Outcome of a scenario run."""
+    def __init__(self, name, work_dir, out_file=None, statuses=None, error=None):
+        super(GamspyScenarioResult, self).__init__()
+        self.name = name
+        self.work_dir = work_dir
+        self.out_file = out_file
+        self.statuses = statuses
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class ScenarioRunner(object):
+    """Run scenarios of a model on a bounded pool of worker processes.
+
+    Each scenario is run on a copy of the base model in the directory
+    work_dir/<scenario name>. Solver threads are split evenly between the
+    processes unless threads is given."""
+    def __init__(self, model, scenarios, work_dir=None, processes=None, threads=None):
+        super(ScenarioRunner, self).__init__()
+        self.model = model
+        self.scenarios = list(scenarios)
+        names = [s.name for s in self.scenarios]
+        if len(set(names))!=len(names):
+            raise ValueError("Scenario names must be unique.")
+        self.work_dir = work_dir if work_dir else model.work_dir
+        self.processes = processes if processes else multiprocessing.cpu_count()
+        self.threads = threads if threads else max(1,multiprocessing.cpu_count()//self.processes)
+
+    def run(self,callback=None):
+        """Run all scenarios and return dict of GamspyScenarioResult by
+        scenario name. If given, callback is called with each result as soon
+        as it is finished."""
+        # Only the model's own labels are sent to the workers
+        self.model.recode_sets()
+        tasks = []
+        for scenario in self.scenarios:
+            scenario_dir = os.path.join(self.work_dir,scenario.name)
+            if not os.path.isdir(scenario_dir):
+                os.makedirs(scenario_dir)
+            tasks.append((self.model,scenario,scenario_dir,self.threads))
+
+        results = {}
+        pool = multiprocessing.Pool(processes=min(self.processes,max(1,len(tasks))))
+        try:
+            for result in pool.imap_unordered(run_scenario,tasks):
+                results[result.name] = result
+                if callback is not None:
+                    callback(result)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return results
+
+
+def run_scenario(task):
+    """Write files for and run one scenario. Executed in a worker process,
+    so model is a private copy of the base model."""
+    model,scenario,work_dir,threads = task
+    try:
+        model.set_work_dir(work_dir)
+        model.options["threads"] = threads
+        scenario.apply(model)
+        model.write_data_file()
+        model.write_model_file()
+        model.run_model()
+        return GamspyScenarioResult(scenario.name,work_dir,model.out_file,model.statuses)
+    except Exception:
+        return GamspyScenarioResult(scenario.name,work_dir,error=traceback.format_exc())
+
+
+class ScenarioBatch(object):
+    """Parameter variants of a model solved one after another in a loop in
+    a single GAMS job (batch_gms.j2), so that GAMS is started and the model
+    compiled only once.
+
+    parameters maps parameter keys of the model to arrays with a leading
+    scenario axis followed by the dimensions of the parameter. Results of
+    all scenarios are written to one output GDX, see GamspyBatchResult."""
+    def __init__(self, model, parameters, names=None, set_name='scen'):
+        super(ScenarioBatch, self).__init__()
+        self.model = model
+        self.parameters = dict((key,np.asarray(data,dtype=np.float64)) for key,data in parameters.items())
+        n_scenarios = set(data.shape[0] for data in self.parameters.values())
+        if len(n_scenarios)!=1:
+            raise ValueError("All parameters must have the same number of scenarios.")
+        n_scenarios = n_scenarios.pop()
+        if names is None:
+            names = ["s{}".format(k+1) for k in range(n_scenarios)]
+        if len(names)!=n_scenarios:
+            raise ValueError("Got {} scenario names for {} scenarios.".format(len(names),n_scenarios))
+        if len(set(names))!=len(names):
+            raise ValueError("Scenario names must be unique.")
+        for key,data in self.parameters.items():
+            p = model.parameters[key]
+            if data.shape[1:]!=tuple(len(ind.data) for ind in (p.indices or [])):
+                raise ValueError("Scenario data for '{}' has shape {}.".format(p.name,data.shape))
+        self.scenario_set = GamspySet(set_name,names)
+
+    def batch_model(self):
+        """Copy of the model with the scenario set, the stacked scenario data
+        and its own files in the model's work dir."""
+        m = copy.copy(self.model)
+        m.sets = dict(self.model.sets)
+        m.parameters = dict(self.model.parameters)
+        m.sets[self.scenario_set.name] = self.scenario_set
+        m.batch_parameters = []
+        for key,data in sorted(self.parameters.items()):
+            p = self.model.parameters[key]
+            stacked = GamspyParameter("{}_{}".format(p.name,self.scenario_set.name),data=data,
+                                      indices=[self.scenario_set]+list(p.indices or []))
+            m.parameters[stacked.name] = stacked
+            m.batch_parameters.append((p,stacked))
+        m.scenario_set = self.scenario_set
+        for attr,suffix in [('model_file','batch_model.gms'),('data_file','batch_input.gdx'),('out_file','batch_output.gdx')]:
+            setattr(m,attr,m._work_file(None,"{}_{}".format(m.name,suffix)))
+        return m
+
+    def run(self,template='batch_gms.j2',timeout=None,log_callbacks=None):
+        """Write files, solve all scenarios in one GAMS job and return a
+        GamspyBatchResult."""
+        m = self.batch_model()
+        m.check_size()
+        m.write_data_file()
+        m.write_model_file(template=template)
+        utils.run_gams(model_file=m.model_file,work_dir=m.work_dir,gams_exec=m.gams_exec,
+                        timeout=timeout,log_callbacks=log_callbacks)
+        return GamspyBatchResult(m,self.scenario_set)
+
+
+class GamspyBatchResult(object):
+    """Results of a ScenarioBatch, read from its output GDX with the
+    scenario as first axis."""
+    def __init__(self, model, scenario_set):
+        super(GamspyBatchResult, self).__init__()
+        self.model = model
+        self.scenario_set = scenario_set
+        self.out_file = model.out_file
+        self.statuses = dict((key,self._get("{}_{}".format(key,scenario_set.name),[],"level").astype(int))
+                             for key in ("modelstat","solvestat"))
+
+    @property
+    def ok(self):
+        """Boolean array, True for scenarios with acceptable status codes."""
+        return np.logical_and.reduce([np.in1d(codes,self.model.accept_codes[key])
+                                      for key,codes in self.statuses.items()])
+
+    def get_variable(self,name,field="level"):
+        """Return field ('level' or 'marginal') of variable by model key as
+        array with shape (scenarios,)+(shape of the variable)."""
+        var = self.model.variables[name]
+        return self._get("{}_{}".format(var.name,self.scenario_set.name),var.indices,field)
+
+    def get_equation(self,name,field="level"):
+        """Return field of equation by model key, see get_variable."""
+        eq = self.model.equations[name]
+        return self._get("{}_{}".format(eq.name,self.scenario_set.name),eq.indices,field)
+
+    def _get(self,symbol,indices,field):
+        # Imported here so that scenarios can be set up without the GAMS API
+        import gdx
+        with gdx.get_reader(self.out_file,lazy=True) as r:
+            return r.get_dense(symbol,[self.scenario_set]+list(indices or []),field=field)
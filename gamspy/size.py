@@ -0,0 +1,106 @@
+# gamspy - Build and run GAMS models from Python
+# Copyright (C) 2014 Joel Goop
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Estimate of the size of a generated model from set cardinalities, index
+# domains, conditions given as sets and the variable references in each
+# equation. Conditions that are not sets are assumed to keep every tuple
+# and all declared variable tuples are counted, so the estimate is an
+# upper bound for most models.
+from .types import GamspySet, GamspyVariable, GamspyExpression, \
+                   GamspyFunctionTypeExpression, GamspyElementView
+
+# Rough memory use of GAMS and solver in bytes per row or column and per
+# nonzero
+MEMORY_PER_ROW_COL = 250
+MEMORY_PER_NONZERO = 150
+
+
+class GamspySizeLimitError(Exception):
+    pass
+
+
+def cardinality(ind):
+    """Number of elements of an index (1 for fixed labels)."""
+    data = getattr(ind,'data',None)
+    return len(data) if data is not None else 1
+
+def domain_size(indices,condition=None):
+    """Number of tuples of indices for which condition holds. A condition
+    that is a set over some of the indices keeps its elements times the
+    tuples of the other indices."""
+    indices = list(indices or [])
+    condition = condition.base if isinstance(condition,GamspyElementView) and isinstance(condition.base,GamspySet) else condition
+    names = [ind.name for ind in indices]
+    size = 1
+    if isinstance(condition,GamspySet) and condition.indices and \
+            all(ind.name in names for ind in condition.indices):
+        cond_names = [ind.name for ind in condition.indices]
+        size = cardinality(condition)
+        indices = [ind for ind in indices if ind.name not in cond_names]
+    for ind in indices:
+        size *= cardinality(ind)
+    return size
+
+def count_nonzeros(expr,row_indices,row_condition=None):
+    """Estimate number of variable references per row of an expression,
+    expanding sums over their (conditioned) index sets."""
+    count = 0
+    stack = [(expr,1.0,list(row_indices or []),row_condition)]
+    while stack:
+        node,factor,indices,condition = stack.pop()
+        if isinstance(node,GamspyElementView):
+            # Suffix references such as x.l are constants
+            if node.suffix:
+                continue
+            node = node.base
+        if isinstance(node,GamspyVariable):
+            count += factor
+        elif isinstance(node,GamspyFunctionTypeExpression):
+            over_sets = getattr(node,'over_sets',None)
+            if over_sets is not None:
+                inner_indices = indices+list(over_sets)
+                factor *= float(domain_size(inner_indices,node.over_condition))/max(domain_size(indices,condition),1)
+                indices,condition = inner_indices,node.over_condition
+            for arg in node.args:
+                stack.append((arg,factor,indices,condition))
+        elif isinstance(node,GamspyExpression):
+            for operand in node.operands:
+                stack.append((operand,factor,indices,condition))
+    return count
+
+def estimate_size(model):
+    """Return dict with estimated rows, columns, nonzeros and memory (bytes)
+    of model, and rows and nonzeros by equation key."""
+    equations = {}
+    for key,eq in model.equations.items():
+        rows = domain_size(eq.indices,eq.conditional)
+        equations[key] = {"rows": rows, "nonzeros": int(rows*count_nonzeros(eq.expr,eq.indices,eq.conditional))}
+    rows = sum(e["rows"] for e in equations.values())
+    columns = sum(domain_size(var.indices,var.conditional) for var in model.variables.values())
+    nonzeros = sum(e["nonzeros"] for e in equations.values())
+    return {"rows": rows,
+            "columns": columns,
+            "nonzeros": nonzeros,
+            "memory": (rows+columns)*MEMORY_PER_ROW_COL + nonzeros*MEMORY_PER_NONZERO,
+            "equations": equations}
+
+def check_limits(estimate,limits):
+    """Raise GamspySizeLimitError if a value in estimate exceeds its limit in
+    limits (keys rows, columns, nonzeros or memory)."""
+    for key,limit in sorted(limits.items()):
+        if limit is not None and estimate[key] > limit:
+            raise GamspySizeLimitError("Estimated {} of model is {}, which exceeds the limit of {}.".format(key,estimate[key],limit))
@@ -0,0 +1,106 @@
+# gamspy - Build and run GAMS models from Python
+# Copyright (C) 2014 Joel Goop
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import re
+
+# GAMS: "--- Executing CPLEX: elapsed 0:00:01.234"
+RE_GAMS_ELAPSED = re.compile(r'elapsed\s+(\d+):(\d+):(\d+(?:\.\d+)?)')
+# CPLEX: "Elapsed time = 1.23 sec. (...)"
+RE_CPLEX_ELAPSED = re.compile(r'Elapsed time\s*=\s*(\d+(?:\.\d+)?)\s*sec')
+# Simplex/barrier: "Iteration:   123   Dual objective = ..."
+RE_ITERATION = re.compile(r'^\s*Iteration:?\s+(\d+)')
+# CPLEX node log: "... Best Integer  Best Bound  ItCnt  Gap". During cut
+# rounds the bound column shows the cuts added, e.g. "Cuts: 4".
+RE_CPLEX_NODE = re.compile(r'^[*\s]\s*\d+[+]?\s+\d+.*?(\S+)\s+([-+]?\d[\d.eE+-]*|[A-Za-z][A-Za-z ]*:\s*\d+)\s+(\d+)\s+(\d+(?:\.\d+)?)%\s*$')
+# Gurobi node log: "... Incumbent  BestBd  Gap  It/Node  Time"
+RE_GUROBI_NODE = re.compile(r'^[\sA-Z*]\s*\d+\s+\d+.*?(\S+)\s+(\S+)\s+(\d+(?:\.\d+)?)%\s+\S+\s+(\d+)s\s*$')
+
+
+def to_float(s):
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+class SolveLogEvent(object):
+    """Progress of a solve, parsed from a GAMS/solver log line. Fields that
+    have not been reported yet are None, gap is a fraction."""
+    def __init__(self, line, elapsed=None, iterations=None, best_bound=None, incumbent=None, gap=None):
+        super(SolveLogEvent, self).__init__()
+        self.line = line
+        self.elapsed = elapsed
+        self.iterations = iterations
+        self.best_bound = best_bound
+        self.incumbent = incumbent
+        self.gap = gap
+
+    def __repr__(self):
+        return "SolveLogEvent(elapsed={}, iterations={}, best_bound={}, incumbent={}, gap={})".format(
+                    self.elapsed,self.iterations,self.best_bound,self.incumbent,self.gap)
+
+
+class SolveLogParser(object):
+    """Parse log lines and keep the latest known progress values."""
+    def __init__(self):
+        super(SolveLogParser, self).__init__()
+        self.state = SolveLogEvent(None)
+
+    def parse(self,line):
+        """Return a SolveLogEvent with the latest progress if line contains
+        any progress information, else None."""
+        values = {}
+        m = RE_GAMS_ELAPSED.search(line)
+        if m:
+            h,mins,secs = m.groups()
+            values["elapsed"] = 3600*int(h) + 60*int(mins) + float(secs)
+        m = RE_CPLEX_ELAPSED.search(line)
+        if m:
+            values["elapsed"] = float(m.group(1))
+        m = RE_ITERATION.match(line)
+        if m:
+            values["iterations"] = int(m.group(1))
+        m = RE_CPLEX_NODE.match(line)
+        if m:
+            incumbent,bound,itcnt,gap = m.groups()
+            values.update(incumbent=to_float(incumbent),best_bound=to_float(bound),
+                          iterations=int(itcnt),gap=float(gap)/100)
+        else:
+            m = RE_GUROBI_NODE.match(line)
+            if m:
+                incumbent,bound,gap,secs = m.groups()
+                values.update(incumbent=to_float(incumbent),best_bound=to_float(bound),
+                              gap=float(gap)/100,elapsed=float(secs))
+        if not values:
+            return None
+        for key,val in values.items():
+            if val is not None:
+                setattr(self.state,key,val)
+        self.state.line = line
+        return SolveLogEvent(**self.state.__dict__)
+
+
+def stop_at_gap(gap):
+    """Log callback that stops the solve when the relative gap is at most gap."""
+    def callback(event):
+        return event.gap is not None and event.gap <= gap
+    return callback
+
+def stop_after(seconds):
+    """Log callback that stops the solve after seconds of elapsed time."""
+    def callback(event):
+        return event.elapsed is not None and event.elapsed >= seconds
+    return callback
@@ -0,0 +1,51 @@
+import sys, os
+import time
+import pytest
+from gamspy.cache import SolveCache
+
+@pytest.fixture
+def cache(tmpdir):
+    return SolveCache(str(tmpdir.join("cache")),max_bytes=250)
+
+def write(tmpdir,name,content):
+    f = tmpdir.join(name)
+    f.write(content)
+    return str(f)
+
+class TestSolveCache:
+    def test_key(self,cache,tmpdir):
+        data = write(tmpdir,"data.gdx","abc")
+        key = cache.make_key(files=[data],texts=["model"],settings=[{"a":1,"b":2}])
+        assert key == cache.make_key(files=[data],texts=["model"],settings=[{"b":2,"a":1}])
+        assert key != cache.make_key(files=[data],texts=["model"],settings=[{"a":1,"b":3}])
+        write(tmpdir,"data.gdx","abd")
+        assert key != cache.make_key(files=[data],texts=["model"],settings=[{"a":1,"b":2}])
+
+    def test_put_and_get(self,cache,tmpdir):
+        out = write(tmpdir,"out.gdx","result")
+        assert not cache.get("k1",{"out.gdx": out})
+        cache.put("k1",{"out.gdx": out})
+        target = str(tmpdir.join("copy.gdx"))
+        assert cache.get("k1",{"out.gdx": target})
+        assert open(target).read() == "result"
+
+    def test_lru_eviction(self,cache,tmpdir):
+        out = write(tmpdir,"out.gdx","x"*100)
+        cache.put("k1",{"out.gdx": out})
+        cache.put("k2",{"out.gdx": out})
+        # Make k2 the least recently used entry
+        past = time.time()-10
+        os.utime(cache.entry_dir("k2"),(past,past))
+        cache.put("k3",{"out.gdx": out})
+        assert sorted(key for _,_,key in cache.entries()) == ["k1","k3"]
+
+    def test_put_existing_entry_is_kept(self,cache,tmpdir):
+        # As if stored by another process between the lookup and put
+        os.makedirs(cache.entry_dir("k1"))
+        with open(os.path.join(cache.entry_dir("k1"),"out.gdx"),'w') as f:
+            f.write("first")
+        cache.put("k1",{"out.gdx": write(tmpdir,"out.gdx","second")})
+        target = str(tmpdir.join("copy.gdx"))
+        assert cache.get("k1",{"out.gdx": target})
+        assert open(target).read() == "first"
+        assert [name for name in os.listdir(cache.cache_dir) if name.startswith('.tmp')] == []
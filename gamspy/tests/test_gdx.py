@@ -0,0 +1,135 @@
+import sys, os
+import numpy as np
+import pytest
+gams = pytest.importorskip("gams")
+from gamspy.gdx import GdxReader, VALID_FIELDS, GdxSymbolNotFoundError, GdxSymbolEmptyError
+
+# Records as read in raw mode: UEL numbers and (level,marginal,lower,upper,scale)
+RECORDS = {
+    'v': (np.array([[1,3],[2,4]],dtype=np.int32),
+          np.array([[1.,.5,0.,np.inf,1.],[2.,0.,-1.,5.,1.]])),
+    'w': (np.array([[2],[1]],dtype=np.int32),
+          np.array([[3.,0.,0.,0.,0.],[4.,0.,0.,0.,0.]])),
+    'z': (np.zeros((1,0),dtype=np.int32),
+          np.array([[7.,1.,0.,0.,1.]])),
+}
+
+@pytest.fixture
+def reader():
+    r = GdxReader('unused.gdx')
+    r.uels = np.array(['','a','b','x','y'],dtype=object)
+    r._read_records = lambda name: RECORDS[name]
+    return r
+
+class TestGetMany:
+    def test_structured_layout(self,reader):
+        out = reader.get_many(['v','z'])
+        v = out['v']
+        assert v.dtype.names == ('key0','key1') + tuple(VALID_FIELDS)
+        assert v.dtype['key0'] == np.int32 and v.dtype['level'] == np.float64
+        assert v['key0'].tolist() == [1,2] and v['key1'].tolist() == [3,4]
+        assert v['level'].tolist() == [1.,2.]
+        assert v['marginal'].tolist() == [.5,0.]
+        assert v['lower'].tolist() == [0.,-1.]
+        assert v['upper'].tolist() == [np.inf,5.]
+        assert out['z'].dtype.names == tuple(VALID_FIELDS)
+        assert out['z']['level'].tolist() == [7.]
+
+    def test_field_selection(self,reader):
+        v = reader.get_many(['v'],fields=['upper','level'])['v']
+        assert v.dtype.names == ('key0','key1','upper','level')
+        assert v['upper'].tolist() == [np.inf,5.]
+
+    def test_invalid_field(self,reader):
+        def fail(name):
+            raise AssertionError('Records read before fields were checked.')
+        reader._read_records = fail
+        with pytest.raises(ValueError):
+            reader.get_many(['v'],fields=['level','value'])
+
+    def test_as_frame(self,reader):
+        out = reader.get_many(['v','w','z'],fields=['level','marginal'],as_frame=True)
+        v = out['v']
+        assert list(v.columns) == ['level','marginal']
+        assert list(v.index) == [('a','x'),('b','y')]
+        assert v.loc[('b','y'),'level'] == 2.
+        assert list(out['w'].index) == ['b','a']
+        assert out['w'].loc['a','level'] == 4.
+        assert len(out['z']) == 1 and out['z']['marginal'].iloc[0] == 1.
+
+    def test_series(self,reader):
+        s = reader.get_series('w',field='level')
+        assert s.to_dict() == {'b': 3., 'a': 4.}
+
+@pytest.fixture(scope="module")
+def gdx_file(tmpdir_factory):
+    d = str(tmpdir_factory.mktemp("gdx"))
+    db = gams.GamsWorkspace(working_directory=d).add_database()
+    i = db.add_set("i",1,"")
+    for label in ["a","b","c"]:
+        i.add_record(label)
+    m = db.add_set("m",2,"")
+    for keys in [("a","b"),("c","a")]:
+        m.add_record(keys)
+    p = db.add_parameter("p",1,"")
+    p.add_record("a").value = 1.5
+    p.add_record("c").value = -2.
+    db.add_parameter("s",0,"").add_record().value = 3.25
+    db.add_parameter("empty",1,"")
+    v = db.add_variable("v",2,gams.VarType.Positive,"")
+    rec = v.add_record(("a","b"))
+    rec.level, rec.marginal, rec.upper = 2., .5, 10.
+    v.add_record(("c","a")).level = 1.
+    db.add_variable("z",0,gams.VarType.Free,"").add_record().level = 7.
+    e = db.add_equation("e",1,gams.EquType.L,"")
+    rec = e.add_record("b")
+    rec.level, rec.marginal, rec.upper = 4., -1., 4.
+    path = os.path.join(d,"data.gdx")
+    db.export(path)
+    return path
+
+class TestLazyReader:
+    def read_both(self,gdx_file,func):
+        out = []
+        for lazy in [False,True]:
+            with GdxReader(gdx_file,lazy=lazy) as r:
+                out.append(func(r))
+        return out
+
+    def test_same_results(self,gdx_file):
+        def read(r):
+            out = {"i": r.get_1d_set_elements("i"), "m": r.get_nd_set_elements("m"),
+                   "p": r.get_parameter("p"), "s": r.get_parameter("s"),
+                   "z": r.get_var_level("z"), "e": r.get_eq_marginal("e")}
+            for field in VALID_FIELDS:
+                out["v."+field] = r.get_eq_or_var("v",field)
+            r.get_symbol_names()
+            out["names"] = (r.param_names,r.set_names,r.var_names,r.eq_names)
+            return out
+        eager,lazy = self.read_both(gdx_file,read)
+        assert lazy == eager
+        assert lazy["m"] == [("a","b"),("c","a")]
+        assert lazy["p"] == {("a",): 1.5, ("c",): -2.} and lazy["s"] == 3.25
+        assert lazy["v.upper"] == {("a","b"): 10., ("c","a"): np.inf}
+        assert lazy["names"] == (["p","s","empty"],["i","m"],["v","z"],["e"])
+
+    @pytest.mark.parametrize("name,getter,error", [
+        ("p","get_1d_set_elements",TypeError),
+        ("v","get_nd_set_elements",TypeError),
+        ("i","get_parameter",TypeError),
+        ("p","get_var_level",TypeError),
+        ("empty","get_parameter",GdxSymbolEmptyError),
+        ("missing","get_parameter",GdxSymbolNotFoundError),
+        ("missing","get_var_level",GdxSymbolNotFoundError),
+    ])
+    def test_same_errors(self,gdx_file,name,getter,error):
+        for lazy in [False,True]:
+            with GdxReader(gdx_file,lazy=lazy) as r:
+                with pytest.raises(error):
+                    getattr(r,getter)(name)
+
+    def test_invalid_field(self,gdx_file):
+        for lazy in [False,True]:
+            with GdxReader(gdx_file,lazy=lazy) as r:
+                with pytest.raises(ValueError):
+                    r.get_eq_or_var("v","value")
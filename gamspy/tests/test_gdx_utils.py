@@ -0,0 +1,78 @@
+import sys, os
+import numpy as np
+import pytest
+from gamspy.gdx_utils import *
+
+class TestGdxBulkWriter:
+    def test_encode_keeps_first_appearance_order(self):
+        w = GdxBulkWriter()
+        assert list(w.encode(['b','a','b','c'])) == [1,2,1,3]
+        assert list(w.encode(['c','d'])) == [3,4]
+        assert w.labels == ['b','a','c','d']
+
+    def test_parameter_skips_zeros_and_nans(self):
+        w = GdxBulkWriter()
+        values = np.array([[1.,0.],[np.nan,2.]])
+        w.add_parameter('p',[['r1','r2'],['c1','c2']],values)
+        name,dim,is_param,keys,vals = w.symbols[0]
+        assert (name,dim,is_param) == ('p',2,True)
+        assert keys.tolist() == [[1,3],[2,4]]
+        assert vals.tolist() == [1.,2.]
+
+    def test_empty_parameter(self):
+        w = GdxBulkWriter()
+        w.add_parameter('p',[None,None])
+        assert w.symbols[0][3].shape == (0,2)
+
+class TestRecordArrays:
+    def test_from_gdx_values(self):
+        values = np.array([1.,GDX_PINF,GDX_MINF,GDX_EPS,GDX_UNDF])
+        out = from_gdx_values(values)
+        assert out[:4].tolist() == [1.,np.inf,-np.inf,0.]
+        assert np.isnan(out[4])
+        assert values[1] == GDX_PINF
+
+    def test_dense_from_records(self):
+        keys = np.array([[1,3],[2,4],[5,3]],dtype=np.int32)
+        values = np.array([1.,2.,3.])
+        lookups = [np.array([-1,1,0,-1,-1,-1]),np.array([-1,-1,-1,0,1,-1])]
+        out = dense_from_records(keys,values,lookups,(3,2),np.nan)
+        assert out.shape == (3,2)
+        assert out[1,0] == 1. and out[0,1] == 2.
+        assert np.isnan(out).sum() == 4
+
+class TestLabelRegistry:
+    def test_encode_decode(self):
+        r = LabelRegistry()
+        codes = r.encode(['b','a','b'])
+        assert codes.dtype == np.int32 and codes.tolist() == [0,1,0]
+        assert r.encode([['a','c']]).tolist() == [[1,2]]
+        assert r.decode(codes).tolist() == ['b','a','b']
+
+    def test_pickle(self):
+        import cPickle
+        r = LabelRegistry()
+        r.encode(['x','y'])
+        copy = cPickle.loads(cPickle.dumps(r,cPickle.HIGHEST_PROTOCOL))
+        assert copy.labels == ['x','y']
+        assert copy.encode(['z','x']).tolist() == [2,0]
+
+    def test_writer_maps_registry_codes(self):
+        r = LabelRegistry()
+        codes = r.encode(['x','y'])
+        w = GdxBulkWriter()
+        w.encode(['y'])
+        assert w.encode_codes(r,codes).tolist() == [2,1]
+        assert w.labels == ['y','x']
+
+class TestParseAlong:
+    def test_parse_along_2d(self):
+        d = {('a','x'):1.,('b','y'):2.,('c','x'):3.}
+        out = parse_along_2d(d,['b','a'],['x','y'])
+        assert out.tolist() == [[0.,2.],[1.,0.]]
+
+    def test_fill_value_and_dtype(self):
+        out = parse_along_1d({('a',):1.},['a','b'],fill_value=-1,dtype=np.int32)
+        assert out.dtype == np.int32 and out.tolist() == [[1],[-1]]
+        out = parse_along_nd({('a','x','u'):5.},(['a'],['x','y'],['u']),fill_value=np.nan)
+        assert out[0,0,0] == 5. and np.isnan(out[0,1,0])
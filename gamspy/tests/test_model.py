@@ -0,0 +1,179 @@
+import sys, os
+import numpy as np
+import pytest
+gams = pytest.importorskip("gams")
+from gamspy.types import *
+from gamspy.model import GamspyModel, GamspyModelInstance
+from gamspy import utils
+from gamspy.utils import make_tmp_dir
+from gamspy.cache import SolveCache
+
+class FakeSyncDb(object):
+    """Records of model instance parameters, and variables to read back."""
+    def __init__(self,variables=None):
+        self.records = {}
+        self.variables = variables or {}
+
+    def get_parameter(self,name):
+        db = self
+        class Param(object):
+            def clear(self):
+                db.records[name] = {}
+            def add_record(self,keys=()):
+                class Record(object):
+                    def __setattr__(self,attr,value):
+                        db.records[name][keys] = value
+                return Record()
+        return Param()
+
+    def get_variable(self,name):
+        class Record(object):
+            def __init__(self,keys,level):
+                self.keys = keys
+                self.level = level
+        return [Record(keys,level) for keys,level in self.variables[name]]
+
+class FakeWorkspace(object):
+    my_eps = 4.94066e-324
+
+class FakeModelInstance(object):
+    def __init__(self,sync_db):
+        self.sync_db = sync_db
+        self.update_types = []
+        self.model_status = 1
+        self.solver_status = 1
+
+    def solve(self,update_type=None):
+        self.update_types.append(update_type)
+
+def make_instance(model,modifiable,sync_db):
+    # Instance with a fake GamsModelInstance, as if instantiated by GAMS
+    inst = GamspyModelInstance.__new__(GamspyModelInstance)
+    inst.model = model
+    inst.workspace = FakeWorkspace()
+    inst.instance = FakeModelInstance(sync_db)
+    inst.modifiable = dict((p.name,p) for p in modifiable)
+    inst.statuses = {}
+    return inst
+
+class TestModelInstance:
+    def setup_method(self,method):
+        self.i = GamspySet('mi',['a','b','c'])
+        self.p = GamspyParameter('p',data=[1.,2.,3.],indices=[self.i])
+        self.s = GamspyParameter('s',data=5.)
+
+    def test_update_leaves_out_zeros_and_nan(self):
+        with make_tmp_dir() as d:
+            db = FakeSyncDb()
+            inst = make_instance(GamspyModel('m',d),[self.p,self.s],db)
+            inst.update(p=[0.,np.nan,4.],s=np.nan)
+            assert db.records == {'p': {('c',): 4.}, 's': {}}
+            inst.update(s=2.)
+            assert db.records['s'] == {(): 2.}
+
+    def test_update_zeros_as_eps(self):
+        self.p.zeros_as_eps = True
+        with make_tmp_dir() as d:
+            db = FakeSyncDb()
+            inst = make_instance(GamspyModel('m',d),[self.p],db)
+            inst.update(p=[0.,np.nan,4.])
+            assert db.records == {'p': {('a',): FakeWorkspace.my_eps, ('c',): 4.}}
+
+    def test_update_sparse(self):
+        with make_tmp_dir() as d:
+            db = FakeSyncDb()
+            inst = make_instance(GamspyModel('m',d),[self.p],db)
+            inst.update(p=GamspySparseData.from_coo(([[0,2]],[7.,0.]),(3,)))
+            assert db.records == {'p': {('a',): 7.}}
+
+    def test_update_not_modifiable(self):
+        with make_tmp_dir() as d:
+            inst = make_instance(GamspyModel('m',d),[self.p],FakeSyncDb())
+            with pytest.raises(ValueError):
+                inst.update(q=[1.,2.,3.])
+
+    def test_solve_missing_records_are_zero(self):
+        with make_tmp_dir() as d:
+            inst = make_instance(GamspyModel('m',d),[self.p],FakeSyncDb())
+            assert inst.solve() == {"modelstat": (1,""), "solvestat": (1,"")}
+            assert inst.instance.update_types == [gams.SymbolUpdateType.Zero]
+            inst.instance.model_status = 4
+            with pytest.raises(utils.GamspyExecutionError):
+                inst.solve()
+
+    def test_get_variable(self):
+        with make_tmp_dir() as d:
+            model = GamspyModel('m',d)
+            model.variables['x'] = GamspyVariable('x',indices=[self.i])
+            model.variables['z'] = GamspyVariable('z')
+            db = FakeSyncDb({'x': [(('a',),1.),(('c',),3.)], 'z': [((),8.)]})
+            inst = make_instance(model,[],db)
+            assert list(inst.get_variable('x')) == [1.,0.,3.]
+            assert inst.get_variable('z') == 8.
+
+class TestCacheKey:
+    def test_gams_exec_in_key(self):
+        with make_tmp_dir() as d:
+            model = GamspyModel('m',d)
+            model.cache = SolveCache(os.path.join(d,'cache'))
+            for path in [model.model_file,model.data_file]:
+                with open(path,'w') as f:
+                    f.write('x')
+            key = model.cache_key()
+            assert model.cache_key() == key
+            model.gams_exec = os.path.join(d,'other','gams')
+            assert model.cache_key() != key
+
+class TestWarmStart:
+    @pytest.fixture
+    def model(self):
+        with make_tmp_dir() as d:
+            model = GamspyModel('m',d)
+            with open(model.out_file,'w') as f:
+                f.write('solution')
+            yield model
+
+    @pytest.mark.parametrize("solver,model_type,settings", [
+        ("cplex","lp",{"advind": 1}),
+        ("cplex","mip",{"advind": 1, "mipstart": 1}),
+        ("gurobi","lp",{}),
+        ("gurobi","miqcp",{"mipstart": 1}),
+        ("conopt","nlp",{}),
+    ])
+    def test_settings_by_solver(self,model,solver,model_type,settings):
+        model.solver,model.model_type = solver,model_type
+        model.warm_start()
+        assert model.options["bratio"] == 0
+        assert model.opt_settings == settings
+        assert open(model.warm_start_file).read() == 'solution'
+        model.clear_warm_start()
+        assert model.warm_start_file is None
+        assert "bratio" not in model.options and model.opt_settings == {}
+
+    def test_without_basis(self,model):
+        model.warm_start(basis=False)
+        assert model.warm_start_file is not None
+        assert "bratio" not in model.options and model.opt_settings == {}
+
+    def test_restores_previous_values(self,model):
+        model.model_type = "mip"
+        model.options["bratio"] = 0.5
+        model.opt_settings.update(advind=2,threads=4)
+        model.warm_start()
+        assert model.options["bratio"] == 0
+        assert model.opt_settings == {"advind": 1, "mipstart": 1, "threads": 4}
+        model.clear_warm_start()
+        assert model.options["bratio"] == 0.5
+        assert model.opt_settings == {"advind": 2, "threads": 4}
+
+    def test_repeated_warm_start(self,model):
+        model.opt_settings["advind"] = 2
+        model.warm_start()
+        model.warm_start()
+        assert model.opt_settings == {"advind": 1}
+        model.clear_warm_start()
+        assert model.opt_settings == {"advind": 2} and "bratio" not in model.options
+        # Nothing left to restore after clearing
+        model.opt_settings["advind"] = 0
+        model.clear_warm_start()
+        assert model.opt_settings == {"advind": 0}
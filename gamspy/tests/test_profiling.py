@@ -0,0 +1,41 @@
+import sys, os
+import pytest
+import cPickle
+from gamspy.profiling import GamspyProfile, peak_memory
+
+class TestGamspyProfile:
+    def test_phases_and_hooks(self):
+        seen = []
+        profile = GamspyProfile(hooks=[lambda phase,metrics: seen.append(phase)])
+        with profile.phase("write_data",records=3) as metrics:
+            metrics["bytes"] = 100
+        profile.record("gams",time=1.5)
+        profile.record_gams({"resusd": 0.5})
+        assert seen == ["write_data","gams","gams_stats"]
+        assert profile.phases["write_data"]["records"] == 3
+        assert profile.phases["write_data"]["time"] >= 0
+        assert profile.as_dict()["gams"] == {"resusd": 0.5}
+
+    def test_repeated_phase_adds_time(self):
+        profile = GamspyProfile()
+        profile.record("gams",time=1.0)
+        profile.record("gams",time=2.0)
+        assert profile.phases["gams"]["time"] == 3.0
+
+    def test_report(self):
+        profile = GamspyProfile()
+        profile.record("write_model",time=0.25,bytes=2048)
+        profile.record_gams({"resgen": 0.1})
+        report = profile.report()
+        assert "write_model" in report and "2048" in report
+        assert "resgen = 0.1" in report
+
+    def test_peak_memory(self):
+        assert peak_memory() is None or peak_memory() > 0
+
+    def test_pickle_without_hooks(self):
+        profile = GamspyProfile(hooks=[lambda phase,metrics: None])
+        profile.record("gams",time=1.0)
+        copy = cPickle.loads(cPickle.dumps(profile,cPickle.HIGHEST_PROTOCOL))
+        assert copy.hooks == [] and copy.phases["gams"]["time"] == 1.0
+        assert len(profile.hooks) == 1
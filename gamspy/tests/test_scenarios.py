@@ -0,0 +1,81 @@
+import sys, os
+import stat
+import pytest
+from gamspy.utils import IS_WINDOWS, run_gams
+from gamspy.scenarios import GamspyScenario, ScenarioRunner
+
+pytestmark = pytest.mark.skipif(IS_WINDOWS,reason="stub executables are shell scripts")
+
+# Writes statuses like the returns_output block of base_gms.j2 and fails if
+# the model file asks for it
+STUB = """#!/bin/sh
+grep -q fail "$1" && exit 3
+cp "$1" out.txt
+printf 'modelstat,1 Optimal\\nsolvestat,1 Normal Completion\\n' > statuses.txt
+"""
+
+class StubModel(object):
+    """Model with the interface used by run_scenario, writing its data and
+    options to the model file instead of GDX and GAMS code."""
+    def __init__(self, work_dir, gams_exec):
+        self.gams_exec = gams_exec
+        self.parameters = {'a': StubParameter()}
+        self.options = {}
+        self.model_options = {}
+        self.opt_settings = {}
+        self.set_work_dir(work_dir)
+
+    def set_work_dir(self,work_dir):
+        self.work_dir = work_dir
+        self.model_file = os.path.join(work_dir,'model.gms')
+        self.out_file = os.path.join(work_dir,'out.txt')
+        self.status_file = os.path.join(work_dir,'statuses.txt')
+
+    def recode_sets(self):
+        pass
+
+    def write_data_file(self):
+        pass
+
+    def write_model_file(self):
+        with open(self.model_file,'w') as f:
+            f.write("a {}\nthreads {}\n".format(self.parameters['a'].data,self.options['threads']))
+            if self.options.get('fail'):
+                f.write("fail\n")
+
+    def run_model(self):
+        run_gams(self.model_file,self.work_dir,gams_exec=self.gams_exec)
+        with open(self.status_file) as f:
+            self.statuses = dict(line.strip().split(',') for line in f)
+
+class StubParameter(object):
+    data = None
+
+@pytest.fixture
+def model(tmpdir):
+    exe = tmpdir.join("gams_stub")
+    exe.write(STUB)
+    exe.chmod(exe.stat().mode | stat.S_IEXEC)
+    return StubModel(str(tmpdir),str(exe))
+
+class TestScenarioRunner:
+    def test_run(self,model,tmpdir):
+        scenarios = [GamspyScenario('low',parameters={'a': 1}),
+                     GamspyScenario('high',parameters={'a': 2}),
+                     GamspyScenario('broken',options={'fail': 1})]
+        finished = []
+        results = ScenarioRunner(model,scenarios,work_dir=str(tmpdir),processes=2,threads=3).run(callback=finished.append)
+        assert sorted(results) == ['broken','high','low'] and len(finished) == 3
+        for name,a in [('low',1),('high',2)]:
+            result = results[name]
+            assert result.ok and result.statuses['modelstat'] == '1 Optimal'
+            assert result.work_dir == str(tmpdir.join(name))
+            assert open(result.out_file).read().split('\n')[:2] == ['a {}'.format(a),'threads 3']
+        assert not results['broken'].ok
+        assert 'GamspyExecutionError' in results['broken'].error
+        # The base model is not changed
+        assert model.parameters['a'].data is None and model.work_dir == str(tmpdir)
+
+    def test_unique_names(self,model):
+        with pytest.raises(ValueError):
+            ScenarioRunner(model,[GamspyScenario('s'),GamspyScenario('s')])
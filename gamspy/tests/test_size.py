@@ -0,0 +1,49 @@
+import sys, os
+import numpy as np
+import pytest
+from gamspy.types import *
+from gamspy.size import estimate_size, check_limits, domain_size, count_nonzeros, GamspySizeLimitError
+
+class Model(object):
+    def __init__(self, variables, equations):
+        self.variables = variables
+        self.equations = equations
+
+@pytest.fixture(scope="module")
+def transport():
+    i = GamspySet('ti',['a','b'])
+    j = GamspySet('tj',['x','y','z'])
+    c = GamspyParameter('tc',data=[[1.,0.,0.],[0.,2.,3.]],indices=[i,j])
+    arc = c.nonzero_subset('tarc')
+    x = GamspyVariable('x',indices=[i,j])
+    z = GamspyVariable('z',vtype='free')
+    equations = {'cost': GamspyEquation('cost', z == gams_sum([i,j],c*x,conditional=arc)),
+                 'supply': GamspyEquation('supply', gams_sum([j],x,conditional=arc) < 10, indices=[i])}
+    return Model({'x': x, 'z': z},equations),arc
+
+class TestEstimateSize:
+    def test_domain_size_with_subset(self,transport):
+        model,arc = transport
+        assert domain_size(arc.indices,arc) == 3
+        assert domain_size(arc.indices) == 6
+
+    def test_estimate(self,transport):
+        model,arc = transport
+        est = estimate_size(model)
+        assert est["rows"] == 3 and est["columns"] == 7
+        assert est["equations"]["cost"]["nonzeros"] == 4
+        assert est["equations"]["supply"]["nonzeros"] == 3
+        assert est["memory"] > 0
+
+    def test_limits(self,transport):
+        model,arc = transport
+        est = estimate_size(model)
+        check_limits(est,{"rows": 3})
+        with pytest.raises(GamspySizeLimitError):
+            check_limits(est,{"nonzeros": 5})
+
+    def test_suffix_references_are_constants(self):
+        i = GamspySet('si',['a','b'])
+        x = GamspyVariable('x',indices=[i])
+        p = GamspyParameter('p',data=[1.,2.],indices=[i])
+        assert count_nonzeros(x.l*p + x,[i]) == 1
@@ -0,0 +1,20 @@
+import sys, os
+import pytest
+from gamspy.solvelog import SolveLogParser
+
+class TestSolveLogParser:
+    def test_cplex_node_line(self):
+        event = SolveLogParser().parse("      10     5      151.0000     2      155.0000      152.0000       45    1.94%")
+        assert (event.incumbent,event.best_bound,event.iterations) == (155.,152.,45)
+        assert abs(event.gap-0.0194) < 1e-12
+
+    def test_cplex_cut_round_has_no_bound(self):
+        parser = SolveLogParser()
+        parser.parse("*     0+    0                          160.0000      150.0000        5    6.25%")
+        event = parser.parse("      0     0      152.0000     3      160.0000      Cuts: 4       12    5.00%")
+        assert event.incumbent == 160.
+        assert event.best_bound == 150.
+        assert event.iterations == 12 and abs(event.gap-0.05) < 1e-12
+
+    def test_other_lines_are_ignored(self):
+        assert SolveLogParser().parse("--- Starting compilation") is None
@@ -0,0 +1,96 @@
+import sys, os
+import numpy as np
+import pytest
+from gamspy.types import *
+from gamspy import utils
+from gamspy.scenarios import ScenarioBatch
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(utils.__file__),'templates')
+
+@pytest.fixture
+def context():
+    i = GamspySet('i',['seattle','san-diego'])
+    j = GamspySet('j',['new-york','chicago','topeka'])
+    a = GamspyParameter('a',indices=[i],data=[350,600])
+    c = GamspyParameter('c',indices=[i,j],data=[[1,2,3],[4,5,6]])
+    x = GamspyVariable('x',indices=[i,j],up=np.ones((2,3)))
+    z = GamspyVariable('z',vtype='free')
+    return dict(name='transport',title=None,author=None,
+                sets={'i': i,'j': j},aliases={},
+                parameters={'a': a,'c': c,'x_up': x.lim_param('up')},
+                variables={'x': x,'z': z},
+                equations={'cost': GamspyEquation('cost',z == gams_sum([i,j],c*x)),
+                           'supply': GamspyEquation('supply',gams_sum([j],x) < a,indices=[i])},
+                data_file='in.gdx',out_file='out.gdx',status_file='st.txt',warm_start_file=None,
+                model_options={},options={'reslim': 1},opt_settings={},model_type='lp',solver='cplex',
+                presolve_assign=[],output_parameters=[],maximize=False,obj_var=z)
+
+def render(template,context):
+    return utils.get_j2_environment([TEMPLATE_DIR]).get_template(template).render(context)
+
+class TestSaveRestart:
+    def test_save_has_structure_but_no_solve(self,context):
+        out = render('save_gms.j2',context)
+        assert 'MODEL transport / all /;' in out
+        loaded = [name for line in out.splitlines() if line.startswith('$load ')
+                        for name in line[6:].split(', ')]
+        assert sorted(loaded) == ['a','c','i','j','x_up']
+        assert 'supply(i)..' in out
+        assert 'SOLVE' not in out and 'x.up(i,j)' not in out
+
+    def test_restart_loads_data_and_solves(self,context):
+        out = render('restart_gms.j2',context)
+        load = [line for line in out.splitlines() if line.startswith('EXECUTE_LOAD')]
+        assert len(load) == 1 and load[0].startswith("EXECUTE_LOAD 'in.gdx', ")
+        assert sorted(load[0][len("EXECUTE_LOAD 'in.gdx', "):-1].split(', ')) == ['a','c','x_up']
+        assert 'x.up(i,j)$x_up(i,j) = x_up(i,j);' in out
+        assert 'SOLVE transport using lp minimizing z;' in out
+        for declaration in ['SETS','PARAMETERS','EQUATIONS','MODEL','..','$load']:
+            assert declaration not in out
+
+class Model(object):
+    def __init__(self, parameters):
+        self.parameters = parameters
+
+class TestBatch:
+    def test_batch_loop(self,context):
+        batch = ScenarioBatch(Model(context['parameters']),{'a': [[1,2],[3,4],[5,6]]},set_name='scen')
+        assert batch.scenario_set.data.tolist() == ['s1','s2','s3']
+        a = context['parameters']['a']
+        a_scen = GamspyParameter('a_scen',data=batch.parameters['a'],indices=[batch.scenario_set]+a.indices)
+        context.update(scenario_set=batch.scenario_set,batch_parameters=[(a,a_scen)])
+        out = render('batch_gms.j2',context)
+        loop = out[out.index('LOOP(scen,'):]
+        assert loop.index('a(i) = a_scen(scen,i);') < loop.index('x.up(i,j)$x_up(i,j) = x_up(i,j);') \
+                < loop.index('SOLVE transport using lp minimizing z;') < loop.index('\n);')
+        assert 'x_scen.l(scen,i,j) = x.l(i,j);' in loop
+        assert 'supply_scen.m(scen,i) = supply.m(i);' in loop
+        assert 'modelstat_scen(scen) = transport.modelstat;' in loop
+        assert "EXECUTE_UNLOAD 'out.gdx';" in out
+        assert 'status_file' not in out
+
+    def test_batch_checks_data(self,context):
+        model = Model(context['parameters'])
+        with pytest.raises(ValueError):
+            ScenarioBatch(model,{'a': np.ones((2,3))})
+        with pytest.raises(ValueError):
+            ScenarioBatch(model,{'a': np.ones((2,2))},names=['s','s'])
+
+class TestSubsetConditions:
+    def test_equation_over_part_of_subset_domain(self,context):
+        i,j = context['sets']['i'],context['sets']['j']
+        x,a = context['variables']['x'],context['parameters']['a']
+        c = context['parameters']['c']
+        c.data = [[1,0,0],[0,0,0]]
+        arc = sparsity_subset('arc',c)
+        src = sparsity_subset('src',(c.data!=0).any(axis=1),indices=[i])
+        context['sets'].update(arc=arc,src=src)
+        context['equations'] = {
+            'supply': GamspyEquation('supply',gams_sum([j],x,conditional=arc) < a,indices=[i],
+                                     conditional=gams_sum([j],1,conditional=arc)),
+            'demand': GamspyEquation('demand',gams_sum([j],x,conditional=arc) < a,indices=[i],
+                                     conditional=src)}
+        out = render('base_gms.j2',context)
+        assert 'supply(i)$(sum((j)$(arc(i,j)),1))..' in out
+        assert 'demand(i)$(src(i))..' in out
+        assert src.data.tolist() == ['seattle']
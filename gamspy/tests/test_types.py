@@ -1,5 +1,7 @@
 import sys, os
+import numpy as np
 from gamspy.types import *
+from gamspy import utils
 import pytest
 
 el_names =  ["test1","test2","test3"]
@@ -56,3 +58,305 @@ class TestIndexString:
         assert str(element) == "{}({})".format(elname,",".join(snames[:-1]))
         assert str(element.no_indices) == elname
         assert str(element.ix(indep_set)) == "{}({})".format(elname,snames[-1])
+
+class TestSparseParameter:
+    @pytest.fixture(scope="class")
+    def sets(self):
+        return [GamspySet('s{}'.format(k),["e{}".format(i) for i in range(n)]) for k,n in enumerate((4,3,5))]
+
+    def test_from_coo(self,sets):
+        data = GamspySparseData.from_coo((([0,3],[1,2],[4,0]),[1.5,2.5]),shape=(4,3,5))
+        p = GamspyParameter('p',data=data,indices=sets)
+        assert p.is_sparse and p.load
+        assert p.data.nnz == 2
+        assert p.data.todense()[3,2,0] == 2.5
+
+    def test_from_series(self,sets):
+        import pandas as pd
+        idx = pd.MultiIndex.from_tuples([('e1','e0','e4'),('e3','e2','e1')])
+        p = GamspyParameter('p',data=pd.Series([1.,2.],index=idx),indices=sets)
+        assert [c.tolist() for c in p.data.coords] == [[1,3],[0,2],[4,1]]
+        assert p.data.shape == (4,3,5)
+
+    def test_from_scipy(self,sets):
+        import scipy.sparse as sps
+        p = GamspyParameter('p',data=sps.eye(4,3,format='csr'),indices=sets[:2])
+        assert p.is_sparse and p.data.nnz == 3
+
+    def test_duplicates_summed(self,sets):
+        data = GamspySparseData.from_coo((([2,0,2],[1,1,1]),[1.,2.,3.]),shape=(4,3))
+        assert [c.tolist() for c in data.coords] == [[0,2],[1,1]]
+        assert data.values.tolist() == [2.,4.]
+        assert data.todense()[2,1] == 4.
+
+    def test_scipy_duplicates_summed(self,sets):
+        import scipy.sparse as sps
+        coo = sps.coo_matrix(([1.,2.,3.],([1,1,0],[2,2,0])),shape=(4,3))
+        p = GamspyParameter('p',data=coo,indices=sets[:2])
+        assert p.data.nnz == 2 and p.data.todense()[1,2] == 3.
+        assert coo.nnz == 3
+
+    def test_coo_tuple_as_data(self,sets):
+        p = GamspyParameter('p',data=(([0,3],[1,2]),[1.5,2.5]),indices=sets[:2])
+        assert p.is_sparse and p.data.shape == (4,3)
+        assert p.data.todense()[3,2] == 2.5
+        # Tuples of rows are dense data
+        q = GamspyParameter('q',data=((1.,2.,3.),(4.,5.,6.)),indices=[GamspySet('r',['a','b']),sets[1]])
+        assert not q.is_sparse and q.data.shape == (2,3)
+
+    def test_wrong_dimension(self,sets):
+        with pytest.raises(ValueError):
+            GamspyParameter('p',data=GamspySparseData(([0],),[1.]),indices=sets)
+
+    def test_add_to_bulk_writer(self,sets):
+        w = gdx_utils.GdxBulkWriter()
+        p = GamspyParameter('p',data=GamspySparseData(([1],[2],[3]),[4.]),indices=sets)
+        p.add_to_db(w)
+        assert w.symbols[0][3].tolist() == [[2,3,4]]
+
+class TestSetCodes:
+    def test_sets_share_registry(self):
+        registry = gdx_utils.LabelRegistry()
+        a = GamspySet('a',['u','v'],registry=registry)
+        b = GamspySet('b',['v','w'],registry=registry)
+        assert a.codes.dtype.name == 'int32'
+        assert a.codes[1] == b.codes[0]
+        assert b.data.tolist() == ['v','w']
+        assert registry.labels == ['u','v','w']
+
+    def test_unattached_sets_keep_own_labels(self):
+        a = GamspySet('a',['u','v'])
+        b = GamspySet('b',['v','w'])
+        assert a.registry is not b.registry
+        assert a.registry.labels == ['u','v'] and b.registry.labels == ['v','w']
+        registry = gdx_utils.LabelRegistry()
+        old = a.registry
+        a.set_registry(registry)
+        b.set_registry(registry)
+        assert registry.labels == ['u','v','w'] and old.labels == ['u','v']
+        assert a.codes[1] == b.codes[0]
+
+    def test_set_registry(self):
+        registry = gdx_utils.LabelRegistry()
+        m = GamspySet('m',[['u','v'],['v','w']],indices=[GamspySet('a',['u','v','w'])]*2)
+        m.set_registry(registry)
+        assert m.registry is registry and registry.labels == ['u','v','w']
+        assert m.codes.tolist() == [[0,1],[1,2]]
+        assert m.data.tolist() == [['u','v'],['v','w']]
+
+    def test_multi_dim_set(self):
+        a = GamspySet('a',['u','v'])
+        m = GamspySet('m',[['u','v'],['v','v']],indices=[a,a])
+        assert m.codes.shape == (2,2)
+        assert m.data.tolist() == [['u','v'],['v','v']]
+
+class TestPandasParameters:
+    @pytest.fixture(scope="class")
+    def sets(self):
+        return [GamspySet('pi',['a','b']),GamspySet('pj',['x','y','z'])]
+
+    def test_series_reuses_sets(self,sets):
+        import pandas as pd
+        series = pd.Series([1.,2.],index=pd.MultiIndex.from_tuples([('b','x'),('a','z')]))
+        p = GamspyParameter('p')
+        p.create_from_series(series,sets)
+        assert p.indices[0] is sets[0] and p.indices[1] is sets[1]
+        assert p.data.todense().tolist() == [[0.,0.,2.],[1.,0.,0.]]
+
+    def test_series_without_copy(self,sets):
+        import pandas as pd
+        series = pd.Series([1.,2.],index=['a','b'])
+        p = GamspyParameter('p')
+        p.create_from_series(series,sets[0])
+        assert p.indices[0] is sets[0]
+        assert np.shares_memory(p.data,series.values)
+
+    def test_dataframe_new_set(self,sets):
+        import pandas as pd
+        df = pd.DataFrame([[1.,2.]],index=['c'],columns=['x','y'])
+        p = GamspyParameter('p')
+        p.create_from_dataframe(df,*sets)
+        assert p.indices[0] is not sets[0] and p.indices[0].name == 'pi'
+        assert p.indices[1].data.tolist() == ['x','y']
+        assert np.shares_memory(p.data,df.values)
+
+class TestVariableBounds:
+    def test_array_bound_is_parameter(self):
+        i = GamspySet('bi',['a','b','c'])
+        x = GamspyVariable('x',indices=[i],up=np.array([1.,0.,np.nan]),lo=2)
+        assert x.get_lim('lo') == 2 and x.lim_param('lo') is None
+        up = x.lim_param('up')
+        assert str(up) == 'x_up(bi)'
+        w = gdx_utils.GdxBulkWriter()
+        up.add_to_db(w)
+        name,dim,is_param,keys,vals = w.symbols[0]
+        assert len(keys) == 2
+        assert vals.tolist() == [1.,gdx_utils.GDX_EPS]
+
+class TestSparsitySubset:
+    @pytest.fixture(scope="class")
+    def sets(self):
+        return [GamspySet('si',['a','b']),GamspySet('sj',['x','y','z'])]
+
+    def test_from_parameter(self,sets):
+        c = GamspyParameter('c',data=[[1.,0.,0.],[0.,2.,3.]],indices=sets)
+        arc = c.nonzero_subset('arc')
+        assert arc.data.tolist() == [['a','x'],['b','y'],['b','z']]
+        assert arc.level == 1 and str(arc) == 'arc(si,sj)'
+
+    def test_from_mask_as_condition(self,sets):
+        sub = sparsity_subset('sub',np.array([False,True]),indices=sets[:1])
+        assert sub.data.tolist() == ['b']
+        x = GamspyVariable('x',indices=sets)
+        assert str(gams_sum([sets[1]],x,conditional=sub)) == 'sum((sj)$(sub(si)),x(si,sj))'
+
+class FakeDatabase(object):
+    """Collects records added through the GamsDatabase interface."""
+    class workspace(object):
+        my_eps = 4.94066e-324
+
+    def __init__(self):
+        self.records = {}
+
+    def add_parameter(self,name,dim,text):
+        db = self
+        class Param(object):
+            def add_record(self,keys):
+                class Record(object):
+                    def __setattr__(self,attr,value):
+                        db.records[keys] = value
+                return Record()
+        return Param()
+
+class TestRecordByRecordLimits:
+    def test_nan_skipped_and_zero_as_eps(self):
+        i = GamspySet('ri',['a','b','c'])
+        x = GamspyVariable('x',indices=[i],up=np.array([1.,0.,np.nan]))
+        db = FakeDatabase()
+        x.lim_param('up').add_to_db(db)
+        assert db.records == {('a',): 1., ('b',): FakeDatabase.workspace.my_eps}
+
+    def test_nan_skipped_in_plain_parameter(self):
+        i = GamspySet('ri',['a','b','c'])
+        db = FakeDatabase()
+        GamspyParameter('p',data=[0.,np.nan,3.],indices=[i]).add_to_db(db)
+        assert db.records == {('c',): 3.}
+
+class TestScalarVariableLimits:
+    @pytest.mark.parametrize("value,rendered",[('INF','INF'),('cap(i)','cap(i)'),(5,'5'),(np.float64(2.5),'2.5')])
+    def test_scalar_and_string_limits(self,value,rendered):
+        i = GamspySet('li',['a','b'])
+        x = GamspyVariable('x',indices=[i],up=value)
+        assert x.lim_param('up') is None
+        env = utils.get_j2_environment([os.path.join(os.path.dirname(utils.__file__),'templates')])
+        out = env.get_template('macros_gms.j2').module.render_variable_lims({'x': x})
+        assert out.strip() == 'x.up(li) = {};'.format(rendered)
+
+    def test_zero_dim_array_is_scalar(self):
+        i = GamspySet('li',['a','b'])
+        assert GamspyVariable('x',indices=[i],lo=np.array(1.)).lim_param('lo') is None
+
+class TestExpressionString:
+    @pytest.fixture(scope="class")
+    def expr(self):
+        i = GamspySet('i')
+        a = GamspyParameter('a',indices=[i])
+        x = GamspyVariable('x',indices=[i])
+        return gams_sum([i],a*x) - 2*(x.l+a) == 3
+
+    def test_iter_str_matches_str(self,expr):
+        assert str(expr) == "sum((i),a(i) * x(i)) - (2 * (x.l(i) + a(i))) =e= 3"
+        assert ''.join(expr.iter_str()) == str(expr)
+
+    def test_wrap_tokens(self,expr):
+        from gamspy.utils import wrap_tokens
+        wrapped = ''.join(wrap_tokens(expr,width=20,wrapstring='\n  '))
+        assert wrapped.split() == str(expr).split()
+        assert all(len(line.strip()) <= 20 for line in wrapped.split('\n'))
+
+class TestFlatExpressions:
+    @pytest.fixture(scope="class")
+    def elements(self):
+        return [GamspyParameter('p{}'.format(k)) for k in range(4)]
+
+    def test_operator_chains(self,elements):
+        a,b,c,d = elements
+        assert str(a + b - c + d) == "p0 + p1 - p2 + p3"
+        assert str(a - (b + c)) == "p0 - (p1 + p2)"
+        assert str(a * b / c * d) == "p0 * p1 / p2 * p3"
+        assert str(a / (b * c)) == "p0 / (p1 * p2)"
+        assert str((a + b) * c + d) == "(p0 + p1) * p2 + p3"
+
+    def test_shared_chain_is_not_changed(self,elements):
+        a,b,c,d = elements
+        base = a + b
+        first = base + c
+        second = base - d
+        assert str(base) == "p0 + p1"
+        assert str(first) == "p0 + p1 + p2"
+        assert str(second) == "p0 + p1 - p3"
+        assert str(first.left) == "p0 + p1"
+        assert first.right is c
+
+    def test_large_sum(self):
+        x = GamspyVariable('x')
+        terms = [GamspyParameter('p{}'.format(k))*x for k in range(10000)]
+        expr = sum(terms)
+        assert len(expr.operands) == 10001
+        assert str(expr).startswith("0 + p0 * x + p1 * x")
+        nested = x
+        for k in range(5000):
+            nested = (nested + 1)*2
+        assert str(nested).startswith("(" * 5000)
+
+class TestElementViews:
+    @pytest.fixture(scope="class")
+    def x(self):
+        return GamspyVariable('x',indices=[GamspySet('i'),GamspySet('j')])
+
+    def test_views_are_light(self,x):
+        for view in [x.no_indices,x.ix(GamspySet('k')),x.l,x.cond('ok'),x.parenthesized()]:
+            assert isinstance(view,GamspyElementView)
+            assert not hasattr(view,'__dict__')
+            assert view.base is x
+            assert str(view) is str(view)
+
+    def test_chained_views(self,x):
+        k = GamspySet('k')
+        assert str(x.ix(k,k).l) == "x.l(k,k)"
+        assert str(x.up.ix(k,k).cond(k)) == "x.up(k,k)$(k)"
+        assert str(x.l.no_indices) == "x.l"
+        assert x.l.vtype == x.vtype
+        assert str(x.l*2 + x.ix(k,k)) == "x.l(i,j) * 2 + x(k,k)"
+
+    def test_copy_and_pickle(self,x):
+        import copy, pickle
+        view = x.ix(GamspySet('k')).l
+        for protocol in [0,2]:
+            assert str(pickle.loads(pickle.dumps(view,protocol))) == "x.l(k)"
+        assert str(copy.deepcopy(view)) == "x.l(k)"
+
+class TestGamspyElementListIndex:
+    def test_index_follows_changes(self):
+        els = GamspyElementList.from_elements([GamspySet(name) for name in el_names])
+        new = GamspySet("new")
+        els.append(new)
+        assert els["new"] is new and els.index("new") == 3
+        els.insert(0,GamspySet("first"))
+        assert els.index("test1") == 1 and els["new"] is new
+        del els["test2"]
+        assert "test2" not in els and els.index("test3") == 2
+        els.remove(new)
+        assert new not in els and len(els) == 3
+        els.reverse()
+        assert els.index("first") == 2
+        sliced = els[1:]
+        assert isinstance(sliced,GamspyElementList) and sliced.index("first") == 1
+        combined = sliced + [GamspySet("last")]
+        assert combined.index("last") == 2 and (sliced*2).index("first") == 1
+
+    def test_unique_names(self):
+        with pytest.raises(ValueError):
+            GamspyElementList.from_elements([GamspySet("a"),GamspySet("a")])
+        els = GamspyElementList.from_elements([GamspySet("a"),GamspySet("a")],unique=False)
+        assert els["a"] is els[0]
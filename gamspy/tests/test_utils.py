@@ -0,0 +1,106 @@
+import sys, os
+import stat
+import time
+import pytest
+from gamspy.utils import IS_WINDOWS, start_gams, run_gams, GamspyExecutionError, \
+                         GamspyExeNotFoundError, GamspyTimeoutError, GamspyCancelledError
+from gamspy.solvelog import stop_at_gap
+from gamspy.profiling import peak_memory, rusage_memory
+
+pytestmark = pytest.mark.skipif(IS_WINDOWS,reason="stub executables are shell scripts")
+
+@pytest.fixture
+def stub_gams(tmpdir):
+    def make_stub(body):
+        exe = tmpdir.join("gams_stub")
+        exe.write("#!/bin/sh\n"+body+"\n")
+        exe.chmod(exe.stat().mode | stat.S_IEXEC)
+        return str(exe)
+    return make_stub
+
+class TestStartGams:
+    def test_success(self,stub_gams,tmpdir):
+        job = start_gams("model.gms",str(tmpdir),gams_exec=stub_gams("exit 0"))
+        assert job.result() == 0
+
+    def test_error_code(self,stub_gams,tmpdir):
+        with pytest.raises(GamspyExecutionError):
+            run_gams("model.gms",str(tmpdir),gams_exec=stub_gams("exit 3"))
+
+    def test_extra_args(self,stub_gams,tmpdir):
+        exe = stub_gams('echo "$@" > args.txt')
+        run_gams("model.gms",str(tmpdir),gams_exec=exe,gams_args=['r','work'])
+        assert tmpdir.join("args.txt").read().split()[-2:] == ['r','work']
+
+    def test_elapsed_ends_with_process(self,stub_gams,tmpdir):
+        job = start_gams("model.gms",str(tmpdir),gams_exec=stub_gams("exit 0"))
+        time.sleep(0.5)
+        assert job.result() == 0
+        assert job.elapsed < 0.4
+
+    def test_not_found(self,tmpdir):
+        with pytest.raises(GamspyExeNotFoundError):
+            start_gams("model.gms",str(tmpdir),gams_exec=str(tmpdir.join("missing")))
+
+    def test_timeout_kills_process_tree(self,stub_gams,tmpdir):
+        marker = tmpdir.join("marker")
+        exe = stub_gams("(sleep 1; touch {}) &\nsleep 10".format(marker))
+        start = time.time()
+        with pytest.raises(GamspyTimeoutError):
+            run_gams("model.gms",str(tmpdir),gams_exec=exe,timeout=0.3)
+        assert time.time()-start < 5
+        time.sleep(1.2)
+        assert not marker.check()
+
+    def test_wait_and_cancel(self,stub_gams,tmpdir):
+        job = start_gams("model.gms",str(tmpdir),gams_exec=stub_gams("sleep 10"))
+        assert not job.wait(0.1)
+        assert not job.done()
+        job.cancel()
+        assert job.done()
+        with pytest.raises(GamspyCancelledError):
+            job.result()
+
+class TestLogCallbacks:
+    def test_events_and_interrupt(self,stub_gams,tmpdir):
+        lines = ["--- Starting compilation",
+                 "Elapsed time = 1.50 sec. (tree size = 0.01 MB, solutions = 1)",
+                 "*     0+    0                          160.0000      150.0000        5    6.25%",
+                 "      10     5      151.0000     2      155.0000      152.0000       45    1.94%"]
+        exe = stub_gams("trap 'exit 0' INT\n" +
+                        "\n".join("echo '{}'".format(l) for l in lines) +
+                        "\nsleep 10 >/dev/null 2>&1 & wait")
+        events = []
+        def record(event):
+            events.append(event)
+        job = start_gams("model.gms",str(tmpdir),gams_exec=exe,log_callbacks=[record,stop_at_gap(0.02)])
+        assert job.wait(5)
+        assert job.interrupted
+        assert job.result() == 0
+        assert [e.elapsed for e in events] == [1.5,1.5,1.5]
+        assert events[1].incumbent == 160. and events[1].best_bound == 150.
+        assert events[2].iterations == 45 and abs(events[2].gap-0.0194) < 1e-9
+
+class TestJ2Environment:
+    def test_shared_environment(self,tmpdir):
+        from gamspy.utils import get_j2_environment
+        tmpdir.join("t.j2").write("{{ x|custom_replace([]) }}")
+        env = get_j2_environment([str(tmpdir)])
+        assert env is get_j2_environment([str(tmpdir)])
+        assert env.get_template("t.j2").render(x="a") == "a"
+        cache_dir = str(tmpdir.join("bcc"))
+        cached_env = get_j2_environment([str(tmpdir)],cache_dir)
+        assert cached_env is not env
+        cached_env.get_template("t.j2")
+        assert os.listdir(cache_dir)
+
+class TestJobMemory:
+    def test_peak_memory_of_each_run(self,stub_gams,tmpdir):
+        big = start_gams("model.gms",str(tmpdir),
+                         gams_exec=stub_gams("exec '{}' -c \"x = ' '*(200<<20)\"".format(sys.executable)))
+        assert big.result() == 0
+        small = start_gams("model.gms",str(tmpdir),gams_exec=stub_gams("exit 0"))
+        assert small.result() == 0
+        assert rusage_memory(big.rusage) > 200<<20
+        assert 0 < rusage_memory(small.rusage) < 100<<20
+        assert peak_memory(children=True) >= rusage_memory(big.rusage)
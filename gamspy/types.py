@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
+import sys
 import copy
 import jinja2
 import numpy as np
@@ -26,9 +27,10 @@ VALID_V_TYPES = ['positive','binary','free']
 VALID_V_SUF = ['l','m','lo','up','fx']
 VALID_EQ_SUF = ['l','m','lo','up']
 
-
 class GamspyAddSubExpression(object):
     """Gams elements that can be added or subtracted to create expressions"""
+    __slots__ = ()
+
     def __init__(self, parenthesis=False):
         super(GamspyAddSubExpression, self).__init__()
         self.parenthesis = parenthesis
@@ -53,24 +55,41 @@ class GamspyAddSubExpression(object):
         new_element.parenthesis = True
         return new_element
 
+    def iter_str(self):
+        """Yield the string representation in pieces."""
+        return iter_str(self)
+
+    def _pieces(self):
+        """Strings and sub-expressions that make up the string
+        representation, expanded by iter_str."""
+        return [str(self)]
+
 
 class GamspyArithmeticExpression(GamspyAddSubExpression):
     """Gams elements that can be added, subtracted, multiplied and divided to create expressions."""
+    __slots__ = ()
+
     def __init__(self,**kwargs):
         super(GamspyArithmeticExpression,self).__init__(**kwargs)
 
     def __div__(self,other):
         if isnumber(other):
-            return GamspyExpression('/',self.parenthesized(),other)
+            return GamspyExpression('/',self._mul_operand('/'),other)
         if not isinstance(other,GamspyArithmeticExpression):
             raise ValueError('Arithmetic not allowed on instance of {}.'.format(other.__class__.__name__))
-        return GamspyExpression('/',self.parenthesized(),other.parenthesized())
+        return GamspyExpression('/',self._mul_operand('/'),other.parenthesized())
     def __mul__(self,other):
         if isnumber(other):
-            return GamspyExpression('*',self.parenthesized(),other)
+            return GamspyExpression('*',self._mul_operand('*'),other)
         if not isinstance(other,GamspyArithmeticExpression):
             raise ValueError('Arithmetic not allowed on instance of {}.'.format(other.__class__.__name__))
-        return GamspyExpression('*',self.parenthesized(),other.parenthesized())
+        return GamspyExpression('*',self._mul_operand('*'),other.parenthesized())
+    def _mul_operand(self,op):
+        # Products and quotients are extended without parentheses
+        if isinstance(self,GamspyExpression) and self._can_extend(op):
+            return self
+        return self.parenthesized()
+
     def __rmul__(self,other):
         return GamspyExpression(str(other))*self
     def __rdiv__(self,other):
@@ -84,40 +103,17 @@ class GamspyArithmeticExpression(GamspyAddSubExpression):
         return GamspyEquationExpression('=e=',self,other)
 
 
-class GamspyElement(object):
-    """Gams elements such as a set or parameter"""
-    def __init__(self, name, indices=None, suffix=None, conditional=None):
-        super(GamspyElement, self).__init__()
-        self.name = name
-        self.indices = indices
-        self.suffix = suffix
-        self.conditional = conditional
-
-    def __str__(self,show_indices=True):
-        suffix_str = ".{}".format(self.suffix) if self.suffix else ""
-        conditional_str = "$({})".format(self.conditional) if self.conditional else ""
-        out_str = self.name + suffix_str
-        if show_indices and self.indices is not None:
-            ind_list = []
-            for ind in self.indices:
-                try:
-                    ind_list.append(str(ind.no_indices))
-                except AttributeError:
-                    ind_list.append(str(ind))
-            out_str += '({})'.format(','.join(ind_list))
-        out_str += conditional_str
-        return out_str
+class GamspyIndexable(object):
+    """Creation of views of elements with other indices, suffix, condition
+    or parenthesis."""
+    __slots__ = ()
 
     @property
     def no_indices(self):
-        no_ind_elem = copy.copy(self)
-        no_ind_elem.indices = None
-        return no_ind_elem
+        return self._view(indices=None)
 
     def with_indices(self,*indices):
-        new_ind_elem = copy.copy(self)
-        new_ind_elem.indices = indices
-        return new_ind_elem
+        return self._view(indices=indices)
 
     def ix(self,*indices):
         if not indices:
@@ -126,14 +122,89 @@ class GamspyElement(object):
             return self.with_indices(*indices)
 
     def cond(self,conditional):
-        new_cond_elem = copy.copy(self)
-        new_cond_elem.conditional = conditional
-        return new_cond_elem
+        return self._view(conditional=conditional)
 
     def lim_getter(self,l):
-        suf_elem = copy.copy(self)
-        suf_elem.suffix = l
-        return suf_elem
+        return self._view(suffix=l)
+
+    def parenthesized(self):
+        return self._view(parenthesis=True)
+
+    def _view(self,**changes):
+        base = self.base if isinstance(self,GamspyElementView) else self
+        attrs = {"indices": self.indices, "suffix": self.suffix, "conditional": self.conditional,
+                 "parenthesis": getattr(self,"parenthesis",False)}
+        attrs.update(changes)
+        view_type = GamspyArithmeticElementView if isinstance(base,GamspyArithmeticExpression) else GamspyElementView
+        return view_type(base,**attrs)
+
+
+def element_str(name,suffix=None,indices=None,conditional=None):
+    suffix_str = ".{}".format(suffix) if suffix else ""
+    conditional_str = "$({})".format(conditional) if conditional else ""
+    out_str = name + suffix_str
+    if indices is not None:
+        ind_list = []
+        for ind in indices:
+            try:
+                ind_list.append(str(ind.no_indices))
+            except AttributeError:
+                ind_list.append(str(ind))
+        out_str += '({})'.format(','.join(ind_list))
+    out_str += conditional_str
+    return out_str
+
+
+class GamspyElement(GamspyIndexable):
+    """Gams elements such as a set or parameter"""
+    def __init__(self, name, indices=None, suffix=None, conditional=None):
+        super(GamspyElement, self).__init__()
+        self.name = name
+        self.indices = indices
+        self.suffix = suffix
+        self.conditional = conditional
+
+    def __str__(self,show_indices=True):
+        return element_str(self.name,self.suffix,self.indices if show_indices else None,self.conditional)
+
+
+class GamspyElementView(GamspyIndexable,GamspyAddSubExpression):
+    """Immutable view of an element with its own indices, suffix, condition
+    and parenthesis. Other attributes are read from the viewed element and
+    the string representation is computed once."""
+    __slots__ = ('base','indices','suffix','conditional','parenthesis','_str')
+
+    def __init__(self, base, indices=None, suffix=None, conditional=None, parenthesis=False):
+        self.base = base
+        self.indices = indices
+        self.suffix = suffix
+        self.conditional = conditional
+        self.parenthesis = parenthesis
+        self._str = None
+
+    def __str__(self):
+        if self._str is None:
+            self._str = element_str(self.base.name,self.suffix,self.indices,self.conditional)
+        return self._str
+
+    def __getattr__(self,attr):
+        if attr in GamspyElementView.__slots__ or attr.startswith('__'):
+            raise AttributeError(attr)
+        if attr in getattr(self.base,'suffixes',()):
+            return self.lim_getter(attr)
+        return getattr(self.base,attr)
+
+    def __getstate__(self):
+        return tuple(getattr(self,attr) for attr in GamspyElementView.__slots__)
+
+    def __setstate__(self,state):
+        for attr,val in zip(GamspyElementView.__slots__,state):
+            setattr(self,attr,val)
+
+
+class GamspyArithmeticElementView(GamspyElementView,GamspyArithmeticExpression):
+    """View of an element that can be used in arithmetic expressions."""
+    __slots__ = ()
 
 
 class GamspyAlias(GamspyElement,GamspyArithmeticExpression):
@@ -148,21 +219,55 @@ class GamspyAlias(GamspyElement,GamspyArithmeticExpression):
 
 class GamspyVariable(GamspyElement,GamspyArithmeticExpression):
     """A variable in GAMS"""
+    suffixes = VALID_V_SUF
 
     def __init__(self, name, indices=None, vtype="positive",up=None,lo=None,l=None,fx=None, **kwargs):
         super(GamspyVariable, self).__init__(name,indices,**kwargs)
         self.vtype = vtype.lower()
         if self.vtype not in VALID_V_TYPES:
             raise ValueError("Variable type {} is unknown.".format(self.vtype))
-        self._up = up
-        self._lo = lo
-        self._l = l
-        self._fx = fx
+        self.lim_params = {}
+        self.set_lim('up',up)
+        self.set_lim('lo',lo)
+        self.set_lim('l',l)
+        self.set_lim('fx',fx)
 
     def get_lim(self,lim):
         if lim not in VALID_V_SUF:
             raise ValueError("Variable limit {} is not valid.".format(lim))
-        return getattr(self,"_{}".format(lim))
+        return getattr(self,"_{}".format(lim),None)
+
+    def set_lim(self,lim,value):
+        """Set limit to a scalar, or to per-index values given as an array
+        with one axis per index, sparse data, a scipy sparse matrix or a
+        Series. Per-index values are written to the input GDX as parameter
+        <name>_<lim> and applied where given (NaNs in dense arrays are
+        left out, zeros are kept as EPS)."""
+        if lim not in VALID_V_SUF:
+            raise ValueError("Variable limit {} is not valid.".format(lim))
+        self.lim_params.pop(lim,None)
+        if self.indices and is_array_data(value):
+            value = GamspyParameter("{}_{}".format(self.name,lim),data=value,indices=self.indices,zeros_as_eps=True)
+            self.lim_params[lim] = value
+        setattr(self,"_{}".format(lim),value)
+
+    def lim_param(self,lim):
+        """Parameter with per-index values of limit, or None."""
+        return self.lim_params.get(lim)
+
+
+def is_array_data(value):
+    """True for per-index data: arrays with at least one axis, lists,
+    sparse data and pandas objects, but not strings or scalars."""
+    if isinstance(value,basestring) or np.isscalar(value):
+        return False
+    if isinstance(value,np.ndarray):
+        return value.ndim>0
+    if isinstance(value,(list,tuple,GamspySparseData)) or hasattr(value,'tocoo'):
+        return True
+    # pandas is optional, and objects of it can only exist if it is imported
+    pd = sys.modules.get('pandas')
+    return pd is not None and isinstance(value,(pd.Series,pd.DataFrame))
 
 
 # Add each limit as a property to variables
@@ -185,19 +290,109 @@ class GamspyDataElement(GamspyElement):
         self._data = np.array(data)
 
 
+def is_coo_tuple(data):
+    """True for a (coords,values) tuple with one coordinate sequence per
+    dimension and one-dimensional values. Dense data given as a tuple of
+    two rows has coordinates and values of the same depth."""
+    return (isinstance(data,tuple) and len(data)==2
+            and np.ndim(data[0])==2 and np.ndim(data[1])==1)
+
+class GamspySparseData(object):
+    """Sparse n-dimensional data as coordinates (one integer array per
+    dimension) and values, for parameters with few nonzero elements.
+    Values of duplicate coordinates are summed, as in scipy.sparse."""
+    def __init__(self, coords, values, shape=None):
+        super(GamspySparseData, self).__init__()
+        self.coords = tuple(np.asarray(c,dtype=np.int64) for c in coords)
+        self.values = np.asarray(values,dtype=np.float64)
+        if any(c.shape!=self.values.shape for c in self.coords):
+            raise ValueError('Coordinate and value arrays must have the same length.')
+        if shape is None:
+            shape = tuple(int(c.max())+1 if c.size else 0 for c in self.coords)
+        self.shape = tuple(shape)
+        if self.coords and self.values.size:
+            self._sum_duplicates()
+
+    def _sum_duplicates(self):
+        flat = np.ravel_multi_index(self.coords,self.shape)
+        unique,inverse = np.unique(flat,return_inverse=True)
+        if unique.size < flat.size:
+            self.values = np.bincount(inverse,weights=self.values,minlength=unique.size)
+            self.coords = tuple(np.unravel_index(unique,self.shape))
+
+    @property
+    def ndim(self):
+        return len(self.coords)
+
+    @property
+    def nnz(self):
+        return self.values.size
+
+    @classmethod
+    def from_coo(cls,coo,shape=None):
+        """Create from a (coords,values) tuple, with one coordinate array
+        per dimension."""
+        coords,values = coo
+        return cls(coords,values,shape)
+
+    @classmethod
+    def from_scipy(cls,matrix):
+        """Create from a scipy.sparse matrix."""
+        coo = matrix.tocoo()
+        return cls((coo.row,coo.col),coo.data,coo.shape)
+
+    @classmethod
+    def from_series(cls,series,index_sets):
+        """Create from a pandas Series with a (Multi)Index, with one level per
+        set in index_sets. Labels are mapped to positions in the set data."""
+        import pandas as pd
+        coords = []
+        for k,s in enumerate(index_sets):
+            pos = pd.Index(s.data).get_indexer(series.index.get_level_values(k).astype(str))
+            if (pos<0).any():
+                raise ValueError("Series contains labels that are not in set '{}'.".format(s.name))
+            coords.append(pos)
+        return cls(coords,series.values,tuple(len(s.data) for s in index_sets))
+
+    def todense(self):
+        out = np.zeros(self.shape)
+        out[self.coords] = self.values
+        return out
+
+
 class GamspySet(GamspyDataElement,GamspyAddSubExpression):
-    """A set in GAMS"""
-    def __init__(self, name, data=None, indices=None, aliasof=None, **kwargs):
+    """A set in GAMS.
+
+    Elements are stored as int32 codes in a label registry, with one column
+    per dimension for sets with more than one dimension. data returns the
+    labels. A set created without a registry has one of its own until it is
+    moved to a shared one (e.g. the model's) with set_registry."""
+    def __init__(self, name, data=None, indices=None, aliasof=None, registry=None, **kwargs):
         if indices is None:
             self.dim = 1
         else:
             self.dim = len(indices)
-        super(GamspySet, self).__init__(name,self.prepare_data(data),indices,**kwargs)
+        self.registry = registry if registry is not None else gdx_utils.LabelRegistry()
+        super(GamspySet, self).__init__(name,data,indices,**kwargs)
         self.level = 0 if indices is None else 1 + max(i.level for i in self.indices)
 
-    @GamspyDataElement.data.setter
+    @property
+    def data(self):
+        if self.codes is None:
+            return None
+        return self.registry.decode(self.codes)
+
+    @data.setter
     def data(self,data):
-        self._data = np.array(self.prepare_data(data))
+        self.codes = None if data is None else self.registry.encode(self.prepare_data(data))
+
+    def set_registry(self,registry):
+        """Re-code elements into registry and use it from now on. The
+        previous registry is dropped unless other sets use it."""
+        if registry is not self.registry:
+            data = self.data
+            self.registry = registry
+            self.codes = None if data is None else registry.encode(data)
 
     def prepare_data(self,data):
         if data is not None and self.dim==1:
@@ -208,22 +403,61 @@ class GamspySet(GamspyDataElement,GamspyAddSubExpression):
         return data
 
     def add_to_db(self,db):
-        if self.dim==1:
+        if isinstance(db,gdx_utils.GdxBulkWriter):
+            db.add_set_uels(self.name,db.encode_codes(self.registry,self.codes))
+        elif self.dim==1:
             gdx_utils.set_from_1d_array(db,self.name,self.data)
         else:
             gdx_utils.set_from_2d_array(db,self.name,self.data)
 
 
+def set_for_labels(idx_set,labels,ordered=False):
+    """Return idx_set if its data contains labels (equals them if ordered),
+    otherwise a new 1-dimensional set with the same name and labels."""
+    labels = np.asarray(labels).astype(str)
+    data = idx_set.data
+    if data is not None and data.ndim==1:
+        if ordered and len(data)==len(labels) and (data==labels).all():
+            return idx_set
+        if not ordered and np.in1d(labels,data).all():
+            return idx_set
+    return GamspySet(name=idx_set.name,data=labels,registry=idx_set.registry)
+
+
 class GamspyParameter(GamspyDataElement,GamspyArithmeticExpression):
     """A parameter in GAMS"""
-    def __init__(self, name, data=None, indices=None, load=None, **kwargs):
+    def __init__(self, name, data=None, indices=None, load=None, zeros_as_eps=False, **kwargs):
+        self.zeros_as_eps = zeros_as_eps
         super(GamspyParameter, self).__init__(name,data,indices,**kwargs)
         if self.data is not None:
-            self.data = self.data.astype('float64')
             self.load = True if load is None else load
         else:
             self.load = False if load is None else load
 
+    @GamspyDataElement.data.setter
+    def data(self,data):
+        # Sparse input is kept as coordinates and values
+        if hasattr(data,'tocoo'):
+            data = GamspySparseData.from_scipy(data)
+        elif is_coo_tuple(data):
+            shape = tuple(len(ind.data) for ind in self.indices) if self.indices else None
+            data = GamspySparseData.from_coo(data,shape)
+        elif hasattr(data,'index') and getattr(data.index,'nlevels',1)>1:
+            data = GamspySparseData.from_series(data,self.indices)
+        if isinstance(data,GamspySparseData):
+            if self.indices is not None and data.ndim!=len(self.indices):
+                raise ValueError('Sparse data for {} has {} dimensions, expected {}.'.format(self.name,data.ndim,len(self.indices)))
+            self._data = data
+        elif data is None:
+            self._data = None
+        else:
+            # No copy if data is already a float64 array
+            self._data = np.asarray(data,dtype=np.float64)
+
+    @property
+    def is_sparse(self):
+        return isinstance(self.data,GamspySparseData)
+
     @property
     def ndim(self):
         return len(self.indices) if self.indices else 0
@@ -235,9 +469,23 @@ class GamspyParameter(GamspyDataElement,GamspyArithmeticExpression):
         return np.atleast_2d(self.data)
 
     def add_to_db(self,db):
-        if self.ndim == 0 or not self.load:
+        if isinstance(db,gdx_utils.GdxBulkWriter):
+            if self.ndim == 0 or not self.load:
+                db.add_parameter(self.name,[None]*self.ndim)
+            elif self.is_sparse:
+                keys = np.column_stack([db.encode_codes(ind.registry,ind.codes)[c] for ind,c in zip(self.indices,self.data.coords)])
+                db.add_parameter_records(self.name,keys,self.data.values,self.zeros_as_eps)
+            else:
+                db.add_parameter_uels(self.name,[db.encode_codes(ind.registry,ind.codes) for ind in self.indices],self.data,self.zeros_as_eps)
+        elif self.ndim == 0 or not self.load:
             num_indices = 0 if not self.indices else len(self.indices)
             db.add_parameter(self.name,num_indices,"")
+        elif self.is_sparse or self.zeros_as_eps or np.isnan(self.data).any():
+            # Add only given values, zeros as EPS of the workspace if kept
+            coords,values = self.records()
+            if self.zeros_as_eps:
+                values = np.where(values==0,db.workspace.my_eps,values)
+            gdx_utils.param_from_coords(db,self.name,[ind.data for ind in self.indices],coords,values)
         elif self.ndim == 1:
             gdx_utils.param_from_1d_array(db,name=self.name, set_list=self.indices[0].data, values=self.data_2d)
         elif self.ndim == 2:
@@ -245,29 +493,146 @@ class GamspyParameter(GamspyDataElement,GamspyArithmeticExpression):
         else:
             raise ValueError('Cannot add data with more than 2 dimensions to GAMS db.')
 
-    def create_from_series(self,series,idx_set):
-        self.data = series.values.astype('float64')
-        self.indices = [GamspySet(name=idx_set.name,data=series.index.values)]
+    def records(self):
+        """Coordinates and values of entries that are written to GDX: not
+        NaN and, unless zeros_as_eps is set, not zero."""
+        if self.is_sparse:
+            coords,values = self.data.coords,self.data.values
+        else:
+            values = self.data.reshape(tuple(len(ind.data) for ind in self.indices))
+            coords = np.nonzero(~np.isnan(values))
+            values = values[coords]
+        keep = ~np.isnan(values) if self.zeros_as_eps else (values!=0) & ~np.isnan(values)
+        return tuple(c[keep] for c in coords),values[keep]
+
+    def nonzero_subset(self,name):
+        """Subset of the parameter's index space where it is nonzero, see
+        sparsity_subset."""
+        return sparsity_subset(name,self)
+
+    def create_from_series(self,series,index_sets):
+        """Set data and indices from a pandas Series with one index level per
+        set in index_sets (a single set is accepted for a plain Index). Sets
+        are reused if they contain all labels of their level, otherwise
+        replaced by a set of the same name with the labels of the level.
+        A Series that covers its set in order is stored dense without
+        copying float64 values, other Series are stored sparse."""
+        if isinstance(index_sets,GamspyElement):
+            index_sets = [index_sets]
+        index = series.index
+        levels = [index.get_level_values(k) for k in range(index.nlevels)]
+        if len(levels)!=len(index_sets):
+            raise ValueError('Series has {} index levels, got {} sets.'.format(len(levels),len(index_sets)))
+        self.indices = [set_for_labels(s,level.unique()) for s,level in zip(index_sets,levels)]
+        if len(levels)==1 and len(series)==len(self.indices[0].data) and \
+                (levels[0].astype(str)==self.indices[0].data).all():
+            self.data = series.values
+        else:
+            self.data = GamspySparseData.from_series(series,self.indices)
 
     def create_from_dataframe(self,df,row_set,col_set):
-        self.data = df.values.astype('float64')
-        self.indices = [GamspySet(name=row_set.name,data=df.index.values),GamspySet(name=col_set.name,data=df.columns.values)]
+        """Set 2-dimensional data from a DataFrame, reusing row_set and
+        col_set if their labels match index and columns in order."""
+        self.indices = [set_for_labels(row_set,df.index,ordered=True),set_for_labels(col_set,df.columns,ordered=True)]
+        self.data = df.values
+
+
+def sparsity_subset(name,source,indices=None):
+    """Create a subset of the product of indices containing the tuples where
+    source is nonzero. source is a GamspyParameter (indices default to its
+    indices) or a boolean mask with one axis per index.
+
+    The subset can be used as condition in sums, e.g.
+    gams_sum([j],x,conditional=arc) for arc = sparsity_subset('arc',c), so
+    that GAMS only generates the tuples in the subset. A condition on an
+    equation may only use sets in its domain, so an equation over i needs
+    the subset summed over j, conditional=gams_sum([j],1,conditional=arc),
+    or a subset of i, e.g. sparsity_subset('src',(c.data!=0).any(axis=1),
+    indices=[i]) for dense c. The subset must be added to the model sets to
+    be exported."""
+    if isinstance(source,GamspyParameter):
+        indices = source.indices if indices is None else indices
+        if source.is_sparse:
+            nonzero = source.data.values!=0
+            coords = tuple(c[nonzero] for c in source.data.coords)
+        else:
+            values = np.asarray(source.data).reshape(tuple(len(ind.data) for ind in indices))
+            coords = np.nonzero((values!=0) & ~np.isnan(values))
+    else:
+        mask = np.asarray(source,dtype=bool)
+        if indices is None or mask.shape!=tuple(len(ind.data) for ind in indices):
+            raise ValueError('A mask needs indices matching its shape.')
+        coords = np.nonzero(mask)
+    registry = indices[0].registry
+    subset = GamspySet(name,indices=list(indices),registry=registry)
+    if all(ind.registry is registry for ind in indices):
+        codes = [ind.codes[c] for ind,c in zip(indices,coords)]
+        subset.codes = codes[0] if len(indices)==1 else np.column_stack(codes).astype(np.int32)
+    else:
+        labels = [ind.data[c] for ind,c in zip(indices,coords)]
+        subset.data = list(labels[0]) if len(indices)==1 else [list(row) for row in zip(*labels)]
+    return subset
 
 
 class GamspyExpression(GamspyArithmeticExpression):
-    """A GAMS expression tree"""
+    """A GAMS expression tree.
+
+    Chains of + and - (or * and /) are stored flat as one list of operands
+    and operators. Nodes created by extending a chain share the list and
+    only differ in how many items they use, so building a sum of n terms
+    term by term takes linear time."""
     def __init__(self,current,left=None,right=None,**kwargs):
         super(GamspyExpression, self).__init__(**kwargs)
         self.current = current
-        self.left = left
-        self.right = right
+        if left is None and right is None:
+            self._terms,self._n = None,0
+        elif type(self) is GamspyExpression and isinstance(left,GamspyExpression) and left._can_extend(current):
+            # Append to list of left chain, or copy it if it has already
+            # been extended by another node
+            if left._n==len(left._terms):
+                self._terms = left._terms
+            else:
+                self._terms = left._terms[:left._n]
+            self._terms += [current,right]
+            self._n = len(self._terms)
+        else:
+            self._terms = [left,current,right]
+            self._n = 3
+
+    def _can_extend(self,op):
+        return type(self) is GamspyExpression and self._terms is not None \
+                and not self.parenthesis and OP_GROUPS.get(op,op)==OP_GROUPS.get(self.current,self.current)
+
+    @property
+    def operands(self):
+        return self._terms[:self._n:2] if self._terms else []
+
+    @property
+    def left(self):
+        if self._n>3:
+            left = copy.copy(self)
+            left._n -= 2
+            left.current = self._terms[left._n-2]
+            left.parenthesis = False
+            return left
+        return self._terms[0] if self._terms else None
+
+    @property
+    def right(self):
+        return self._terms[self._n-1] if self._terms else None
 
     def __str__(self):
-        if self.right is None and self.left is None:
-            return str(self.current)
-        else:
-            main_expr = '{} {} {}'.format(self.left,self.current,self.right)
-            return main_expr if not self.parenthesis else '({})'.format(main_expr)
+        return ''.join(iter_str(self))
+
+    def _pieces(self):
+        if self._terms is None:
+            return [str(self.current)]
+        pieces = ['('] if self.parenthesis else []
+        for k in xrange(self._n):
+            pieces.append(self._terms[k] if k%2==0 else ' {} '.format(self._terms[k]))
+        if self.parenthesis:
+            pieces.append(')')
+        return pieces
 
 
 class GamspyFunctionTypeExpression(GamspyExpression):
@@ -277,15 +642,43 @@ class GamspyFunctionTypeExpression(GamspyExpression):
         self.funcname = funcname
         self.args = args
 
-    def __str__(self):
-        return '{}({})'.format(self.funcname,','.join(map(str,self.args)))
+    def _pieces(self):
+        pieces = ['{}('.format(self.funcname)]
+        for i,arg in enumerate(self.args):
+            if i:
+                pieces.append(',')
+            pieces.append(arg)
+        pieces.append(')')
+        return pieces
+
+
+# Operators that can be chained in one flat expression
+OP_GROUPS = {'+': '+', '-': '+', '*': '*', '/': '*'}
+
+def iter_str(value):
+    """Yield string representation of an expression or other value in
+    pieces. Expressions are expanded with an explicit stack instead of
+    recursion, so deep expressions cannot hit the recursion limit."""
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item,basestring):
+            yield item
+        elif isinstance(item,GamspyAddSubExpression):
+            stack.extend(reversed(item._pieces()))
+        else:
+            yield str(item)
 
 
 def func_over_sets(func,over_sets,arg,conditional=None):
     over_sets_arg = '({})'.format(','.join((s.name for s in over_sets)))
     if conditional is not None:
         over_sets_arg += '$({})'.format(conditional)
-    return GamspyFunctionTypeExpression(func,(over_sets_arg,arg))
+    expr = GamspyFunctionTypeExpression(func,(over_sets_arg,arg))
+    # Kept for estimating model size
+    expr.over_sets = over_sets
+    expr.over_condition = conditional
+    return expr
 def gams_sum(*args,**kwargs):
     return func_over_sets('sum',*args,**kwargs)
 def gams_prod(*args,**kwargs):
@@ -304,6 +697,8 @@ class GamspyEquationExpression(GamspyExpression):
 
 class GamspyEquation(GamspyElement):
     """A Gams 'equation', i.e. equality or inequality."""
+    suffixes = VALID_EQ_SUF
+
     def __init__(self, name, expr, indices=None,conditional=None,**kwargs):
         super(GamspyEquation, self).__init__(name,indices,**kwargs)
         self.name = name
@@ -316,15 +711,49 @@ for l in VALID_EQ_SUF:
     setattr(GamspyEquation,l,property(functools.partial(GamspyEquation.lim_getter,l=l)))
 
 class GamspyElementList(list):
-    """List of elements that allows selection by name."""
+    """List of elements that allows selection by name.
+
+    Positions are indexed by name, so that selection by name takes constant
+    time. The index is updated on append and extend and rebuilt on the next
+    lookup after other changes. If several elements have the same name, the
+    first one is selected. Membership and removal compare elements by
+    identity or, for strings, by name."""
+    def __init__(self, elements=()):
+        super(GamspyElementList, self).__init__(elements)
+        self._index = None
+
+    @classmethod
+    def from_elements(cls,elements,unique=True):
+        """Create list and index in one pass. If unique is True, a
+        ValueError is raised for duplicate names."""
+        new_list = cls()
+        list.extend(new_list,elements)
+        index = {}
+        for pos,el in enumerate(new_list):
+            if index.setdefault(el.name,pos)!=pos and unique:
+                raise ValueError("Name '{}' is not unique.".format(el.name))
+        new_list._index = index
+        return new_list
+
+    @property
+    def name_index(self):
+        if self._index is None:
+            index = {}
+            for pos,el in enumerate(self):
+                index.setdefault(el.name,pos)
+            self._index = index
+        return self._index
+
+    def names(self):
+        return [el.name for el in self]
+
     def __getitem__(self, item):
         # If item is string, get by name
         if isinstance(item,basestring):
-            result = next((x for x in self if x.name == item), None)
-            if not result:
+            try:
+                return list.__getitem__(self,self.name_index[item])
+            except KeyError:
                 raise IndexError("Key '{}' not found.".format(item))
-            else:
-                return result
         # Else use list.__getitem__ but if item is slice object
         # create new object with correct type
         else:
@@ -339,3 +768,76 @@ class GamspyElementList(list):
         return GamspyElementList(list.__add__(self,other))
     def __mul__(self,other):
         return GamspyElementList(list.__mul__(self,other))
+    __rmul__ = __mul__
+
+    def __contains__(self,item):
+        if isinstance(item,basestring):
+            return item in self.name_index
+        return any(el is item for el in self)
+
+    def index(self,item,start=0,stop=None):
+        if isinstance(item,basestring) and start==0 and stop is None:
+            try:
+                return self.name_index[item]
+            except KeyError:
+                raise ValueError("Key '{}' not found.".format(item))
+        stop = len(self) if stop is None else stop
+        for pos in xrange(*slice(start,stop).indices(len(self))):
+            el = list.__getitem__(self,pos)
+            if el is item or (isinstance(item,basestring) and el.name==item):
+                return pos
+        raise ValueError("Element not found.")
+
+    # Changes that keep positions of existing elements update the index
+    def append(self,el):
+        list.append(self,el)
+        if self._index is not None:
+            self._index.setdefault(el.name,len(self)-1)
+    def extend(self,elements):
+        start = len(self)
+        list.extend(self,elements)
+        if self._index is not None:
+            for pos in xrange(start,len(self)):
+                self._index.setdefault(list.__getitem__(self,pos).name,pos)
+    def __iadd__(self,elements):
+        self.extend(elements)
+        return self
+
+    # Other changes invalidate the index
+    def _changed(self):
+        self._index = None
+    def __setitem__(self,item,value):
+        if isinstance(item,basestring):
+            item = self.index(item)
+        list.__setitem__(self,item,value)
+        self._changed()
+    def __delitem__(self,item):
+        if isinstance(item,basestring):
+            item = self.index(item)
+        list.__delitem__(self,item)
+        self._changed()
+    def __setslice__(self,i,j,elements):
+        list.__setslice__(self,i,j,elements)
+        self._changed()
+    def __delslice__(self,i,j):
+        list.__delslice__(self,i,j)
+        self._changed()
+    def __imul__(self,n):
+        list.__imul__(self,n)
+        self._changed()
+        return self
+    def insert(self,pos,el):
+        list.insert(self,pos,el)
+        self._changed()
+    def pop(self,*args):
+        el = list.pop(self,*args)
+        self._changed()
+        return el
+    def remove(self,item):
+        del self[self.index(item)]
+    def sort(self,*args,**kwargs):
+        list.sort(self,*args,**kwargs)
+        self._changed()
+    def reverse(self):
+        list.reverse(self)
+        self._changed()
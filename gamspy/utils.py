@@ -20,8 +20,16 @@ import contextlib
 import subprocess as sp
 import os
 import errno
+import signal
+import threading
+import time
 import platform
+import sys
+import re
+import jinja2
+from solvelog import SolveLogParser
 IS_WINDOWS = platform.system()=='Windows'
+RE_WHITESPACE = re.compile(r'\s+')
 
 
 @contextlib.contextmanager
@@ -79,30 +87,219 @@ def custom_replace(values,replacements):
         return v
     return map(repl,values)
 
+def wrap_tokens(value,width=79,wrapstring='\n'):
+    """Wrap text at whitespace like the wordwrap filter, but read it piece by
+    piece from value.iter_str() if available and yield one line at a time,
+    so that long expressions are not built as one string."""
+    tokens = value.iter_str() if hasattr(value,'iter_str') else [str(value)]
+    line = []
+    line_len = 0
+    word = ''
+    for token in tokens:
+        pieces = RE_WHITESPACE.split(token)
+        word += pieces[0]
+        for piece in pieces[1:]:
+            if word:
+                if line and line_len+1+len(word) > width:
+                    yield ' '.join(line)
+                    yield wrapstring
+                    line,line_len = [],0
+                line_len += len(word)+1 if line else len(word)
+                line.append(word)
+            word = piece
+    if word:
+        if line and line_len+1+len(word) > width:
+            yield ' '.join(line)
+            yield wrapstring
+            line = []
+        line.append(word)
+    if line:
+        yield ' '.join(line)
+
 def fix_path(p):
     return p.replace('/','\\') if IS_WINDOWS else p
 
-def run_gams(model_file,work_dir,gams_exec=None,quiet=True):
-    """Run gams executable."""
+def run_gams(model_file,work_dir,gams_exec=None,quiet=True,timeout=None,log_callbacks=None,gams_args=None):
+    """Run gams executable and wait for it to finish."""
+    start_gams(model_file,work_dir,gams_exec=gams_exec,quiet=quiet,timeout=timeout,
+                log_callbacks=log_callbacks,gams_args=gams_args).result()
+
+def start_gams(model_file,work_dir,gams_exec=None,quiet=True,timeout=None,log_callbacks=None,gams_args=None):
+    """Start gams executable without waiting and return a GamsJob. If timeout
+    is given, the process is killed after timeout seconds. gams_args is a
+    list of extra command line arguments, e.g. ['r','work'] to restart from
+    a work file.
+
+    If log_callbacks are given, the log is streamed and each callback is
+    called with a solvelog.SolveLogEvent for every line with progress
+    information. If a callback returns True, the solve is interrupted."""
     if not gams_exec:
         gams_exec = "gams"
 
-    # Run GAMS and check return code
     print "Running GAMS on {} in {}".format(model_file,work_dir)
+    quiet_args = []
+    if quiet:
+        # Set arguments to prevent GAMS from writing output (platform-dependent)
+        quiet_args += ['o','nul'] if IS_WINDOWS else ['o','/dev/null']
+    if log_callbacks:
+        # Log to stdout, which is piped to the callbacks
+        quiet_args += ['lo','3']
+    elif quiet:
+        quiet_args += ['lo','0']
+    return GamsJob([gams_exec,os.path.basename(model_file)]+quiet_args+list(gams_args or []),work_dir,
+                    timeout=timeout,log_callbacks=log_callbacks,echo_log=not quiet)
+
+class GamsJob(object):
+    """A GAMS process running in its own process group, so that it can be
+    cancelled together with the solver processes it starts."""
+    def __init__(self, args, work_dir, timeout=None, log_callbacks=None, echo_log=False):
+        super(GamsJob, self).__init__()
+        self.args = args
+        self.timed_out = False
+        self.cancelled = False
+        self.interrupted = False
+        self.log_callbacks = list(log_callbacks) if log_callbacks else []
+        self.echo_log = echo_log
+        if IS_WINDOWS:
+            kwargs = {"creationflags": sp.CREATE_NEW_PROCESS_GROUP}
+        else:
+            kwargs = {"preexec_fn": os.setsid}
+        if self.log_callbacks:
+            kwargs.update(stdout=sp.PIPE,stderr=sp.STDOUT)
+        try:
+            self.process = sp.Popen(args,cwd=work_dir,**kwargs)
+        except OSError as e:
+            if e.errno==errno.ENOENT:
+                raise GamspyExeNotFoundError("The GAMS executable '{}' was not found.".format(args[0]))
+            else:
+                raise
+        # The process is only waited for in this thread, which records when
+        # it finished
+        self.start_time = time.time()
+        self.end_time = None
+        # Resource usage of the finished process (None on Windows)
+        self.rusage = None
+        self._wait_thread = threading.Thread(target=self._wait_process)
+        self._wait_thread.daemon = True
+        self._wait_thread.start()
+        self._log_thread = None
+        if self.log_callbacks:
+            self._log_thread = threading.Thread(target=self._read_log)
+            self._log_thread.daemon = True
+            self._log_thread.start()
+        self._timer = None
+        if timeout is not None:
+            self._timer = threading.Timer(timeout,self._on_timeout)
+            self._timer.daemon = True
+            self._timer.start()
+
+    @property
+    def returncode(self):
+        return self.process.returncode if self.done() else None
+
+    @property
+    def elapsed(self):
+        """Seconds from start until the process finished (or until now)."""
+        return (self.end_time if self.end_time is not None else time.time()) - self.start_time
+
+    def done(self):
+        return self.end_time is not None
+
+    def wait(self,timeout=None):
+        """Wait for process to finish, at most timeout seconds if given.
+        Return True if finished."""
+        end = None if timeout is None else time.time() + timeout
+        # Join in short steps so that KeyboardInterrupt is not blocked
+        while not self.done() and (end is None or time.time() < end):
+            self._wait_thread.join(0.05 if end is None else min(0.05,max(0,end-time.time())))
+        finished = self.done()
+        if finished and self._timer is not None:
+            self._timer.cancel()
+        if finished and self._log_thread is not None:
+            self._log_thread.join()
+        return finished
+
+    def cancel(self):
+        """Kill the GAMS process tree."""
+        if not self.done():
+            self.cancelled = True
+            kill_process_tree(self.process)
+            self.wait()
+
+    def interrupt(self):
+        """Ask GAMS to stop the solve and report the best solution found,
+        as when pressing Ctrl-C/Ctrl-Break."""
+        if not self.done():
+            self.interrupted = True
+            try:
+                if IS_WINDOWS:
+                    self.process.send_signal(signal.CTRL_BREAK_EVENT)
+                else:
+                    os.killpg(self.process.pid,signal.SIGINT)
+            except OSError as e:
+                if e.errno!=errno.ESRCH:
+                    raise
+
+    def result(self,timeout=None):
+        """Wait for process and raise if it failed, timed out or was
+        cancelled. Return the return code."""
+        if not self.wait(timeout):
+            raise GamspyTimeoutError("GAMS did not finish within {} s.".format(timeout))
+        if self.timed_out:
+            raise GamspyTimeoutError("GAMS was killed after reaching its time limit.")
+        if self.cancelled:
+            raise GamspyCancelledError("GAMS run was cancelled.")
+        if self.returncode != 0:
+            raise GamspyExecutionError("GAMS returned with an error. Return code is {}.".format(self.returncode))
+        return self.returncode
+
+    def _read_log(self):
+        parser = SolveLogParser()
+        for line in iter(self.process.stdout.readline,''):
+            if self.echo_log:
+                sys.stdout.write(line)
+            event = parser.parse(line.rstrip())
+            if event is None:
+                continue
+            for callback in self.log_callbacks:
+                if callback(event) and not self.interrupted:
+                    self.interrupt()
+        self.process.stdout.close()
+
+    def _wait_process(self):
+        if hasattr(os,'wait4'):
+            # wait4 also gives the resource usage of this process only
+            # (including the solvers it waited for), not of all children
+            while True:
+                try:
+                    _,status,self.rusage = os.wait4(self.process.pid,0)
+                except OSError as e:
+                    if e.errno==errno.EINTR:
+                        continue
+                    if e.errno!=errno.ECHILD:
+                        raise
+                    self.process.wait()
+                else:
+                    self.process._handle_exitstatus(status)
+                break
+        else:
+            self.process.wait()
+        self.end_time = time.time()
+
+    def _on_timeout(self):
+        if not self.done():
+            self.timed_out = True
+            kill_process_tree(self.process)
+
+def kill_process_tree(process):
+    """Kill process and its children (process must lead its own group)."""
     try:
-        quiet_args = []
-        if quiet:
-            # Set arguments to prevent GAMS from writing output (platform-dependent)
-            quiet_args += ['o','nul'] if IS_WINDOWS else ['o','/dev/null']
-            quiet_args += ['lo','0']
-        p = sp.Popen([gams_exec,os.path.basename(model_file)]+quiet_args,cwd=work_dir)
-        p.wait()
-        if p.returncode != 0:
-            raise GamspyExecutionError("GAMS returned with an error. Return code is {}.".format(p.returncode))
-    except OSError as e:
-        if e.errno==errno.ENOENT:
-            raise GamspyExeNotFoundError("The GAMS executable '{}' was not found.".format(gams_exec))
+        if IS_WINDOWS:
+            sp.call(['taskkill','/F','/T','/PID',str(process.pid)])
         else:
+            os.killpg(process.pid,signal.SIGKILL)
+    except OSError as e:
+        if e.errno!=errno.ESRCH:
             raise
 
 class GamspyExeNotFoundError(Exception):
@@ -111,9 +308,40 @@ class GamspyExeNotFoundError(Exception):
 class GamspyExecutionError(Exception):
     pass
 
+class GamspyTimeoutError(GamspyExecutionError):
+    pass
+
+class GamspyCancelledError(GamspyExecutionError):
+    pass
+
 
 j2env = {
-        "filters": {"select_vtype":select_vtype,"custom_replace":custom_replace,"append_dict":append_dict,"fix_path": fix_path},
+        "filters": {"select_vtype":select_vtype,"custom_replace":custom_replace,"append_dict":append_dict,"fix_path": fix_path,"wrap_tokens": wrap_tokens},
         "tests": {"equalto":test_equalto,"startswith":test_startswith,"in":test_in,"contains_from":test_contains_from},
         "globals": {"enumerate":enumerate,"zip":zip}
-    }
\ No newline at end of file
+    }
+
+# Shared jinja2 environments by (template dirs, bytecode cache dir)
+_j2_environments = {}
+_j2_lock = threading.Lock()
+
+def get_j2_environment(template_dirs,bytecode_cache_dir=None):
+    """Return a process-wide jinja2 environment for template_dirs with the
+    filters, tests and globals in j2env. Compiled templates are kept by the
+    environment and, if bytecode_cache_dir is given, also on disk so that new
+    processes can skip compilation."""
+    key = (tuple(template_dirs),bytecode_cache_dir)
+    with _j2_lock:
+        env = _j2_environments.get(key)
+        if env is None:
+            bytecode_cache = None
+            if bytecode_cache_dir:
+                if not os.path.isdir(bytecode_cache_dir):
+                    os.makedirs(bytecode_cache_dir)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+            env = jinja2.Environment(loader=jinja2.FileSystemLoader(list(template_dirs)),bytecode_cache=bytecode_cache)
+            env.filters.update(j2env['filters'])
+            env.tests.update(j2env['tests'])
+            env.globals.update(j2env['globals'])
+            _j2_environments[key] = env
+    return env